@@ -0,0 +1,54 @@
+"""add medicine composition key
+
+Revision ID: 7c1e4b2a9d30
+Revises: 
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e4b2a9d30'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# medicines backfilled per executemany
+BACKFILL_BATCH_SIZE = 1000
+
+
+def normalize_composition(composition):
+    """
+    istore.app.utils.normalize_composition as of this revision, frozen so the
+    migration doesn't import the app and its database clients
+    """
+    if not composition:
+        return None
+    parts = (" ".join(part.split()) for part in re.split(r"[+,]", composition.lower()))
+    return " + ".join(sorted(part for part in parts if part))[:255] or None
+
+
+def upgrade() -> None:
+    op.add_column('medicine_master', sa.Column('composition_key', sa.String(length=255), nullable=True))
+    op.create_index(op.f('ix_medicine_master_composition_key'), 'medicine_master', ['composition_key'], unique=False)
+
+    # backfill the normalised composition of the existing medicines
+    connection = op.get_bind()
+    medicines = connection.execute(sa.text("SELECT medicine_id, composition FROM medicine_master")).fetchall()
+    update = sa.text("UPDATE medicine_master SET composition_key = :composition_key WHERE medicine_id = :medicine_id")
+    for start in range(0, len(medicines), BACKFILL_BATCH_SIZE):
+        connection.execute(update, [
+            {"composition_key": normalize_composition(composition), "medicine_id": medicine_id}
+            for medicine_id, composition in medicines[start:start + BACKFILL_BATCH_SIZE]
+        ])
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_medicine_master_composition_key'), table_name='medicine_master')
+    op.drop_column('medicine_master', 'composition_key')
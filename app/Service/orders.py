@@ -51,23 +51,23 @@ async def get_order_collection(store_id: int, db):
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
     
-async def get_order_collection_delivered(store_id: int, db):
+async def get_order_collection_delivered(store_id: int, db, limit:int=None, cursor:str=None, fields:str=None):
     """
     Get a specific order from the database.
     """
     try:
-        order = await get_order_collection_delivered_db(store_id=store_id, db=db)
+        order = await get_order_collection_delivered_db(store_id=store_id, db=db, limit=limit, cursor=cursor, fields=fields)
         return order
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
-async def get_order_collection_pending(store_id: int, db):
+async def get_order_collection_pending(store_id: int, db, limit:int=None, cursor:str=None, fields:str=None):
     """
     Get a specific order from the database.
     """
     try:
-        order = await get_order_collection_pending_db(store_id=store_id, db=db)
+        order = await get_order_collection_pending_db(store_id=store_id, db=db, limit=limit, cursor=cursor, fields=fields)
         return order
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
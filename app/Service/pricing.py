@@ -1,30 +1,31 @@
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..db.mongodb import get_database
 from ..models.store_mongodb_models import Pricing
 from ..schemas.Pricing import UpdatePricing
 from ..models.store_mysql_models import StoreDetails, MedicineMaster
 import logging
-from ..utils import validate_by_id, discount
+from ..utils import validate_by_id_async, discount
 from datetime import datetime
 from ..crud.pricing import create_pricing_collection_db, delete_pricing_collection_db, get_all_collection_db
+from ..crud.inventory import refresh_inventory_db
 
 # Configure logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-async def create_pricing_collection(pricing: Pricing, db, mysql_db: Session):
+async def create_pricing_collection(pricing: Pricing, db, mysql_db: AsyncSession):
     """
     Creating the pricing collection in the database.
     """
     try:
         pricing_dict = pricing.dict()
         # Validate store
-        validate_store = validate_by_id(id=pricing_dict["store_id"], model=StoreDetails, field="store_id", db=mysql_db)
+        validate_store = await validate_by_id_async(id=pricing_dict["store_id"], model=StoreDetails, field="store_id", db=mysql_db)
         if validate_store == "unique":
             raise HTTPException(status_code=400, detail="Store not found")
         # Validate medicine
-        validate_medicine = validate_by_id(id=pricing_dict["medicine_id"], model=MedicineMaster, field="medicine_id", db=mysql_db)
+        validate_medicine = await validate_by_id_async(id=pricing_dict["medicine_id"], model=MedicineMaster, field="medicine_id", db=mysql_db)
         if validate_medicine == "unique":
             raise HTTPException(status_code=400, detail="Medicine not found")
         # Discount medicine
@@ -46,22 +47,23 @@ async def create_pricing_collection(pricing: Pricing, db, mysql_db: Session):
             "active_flag": 1
         }
         pricing_medicine = await create_pricing_collection_db(pricing=result, db=db)
+        await refresh_inventory_db(pricing_dict["store_id"], [pricing_dict["medicine_id"]], db, mysql_db)
         return pricing_medicine
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
-async def get_all_collection(store_id: int, medicine_id: int, db, mysql_db: Session):
+async def get_all_collection(store_id: int, medicine_id: int, db, mysql_db: AsyncSession):
     """
     Getting all the pricing by store
     """
     try:
         # Validate store
-        validate_store = validate_by_id(id=store_id, model=StoreDetails, field="store_id", db=mysql_db)
+        validate_store = await validate_by_id_async(id=store_id, model=StoreDetails, field="store_id", db=mysql_db)
         if validate_store == "unique":
             raise HTTPException(status_code=400, detail="Store not found")
         # Validate medicine
-        validate_medicine = validate_by_id(id=medicine_id, model=MedicineMaster, field="medicine_id", db=mysql_db)
+        validate_medicine = await validate_by_id_async(id=medicine_id, model=MedicineMaster, field="medicine_id", db=mysql_db)
         if validate_medicine == "unique":
             raise HTTPException(status_code=400, detail="Medicine not found")
 
@@ -71,21 +73,22 @@ async def get_all_collection(store_id: int, medicine_id: int, db, mysql_db: Sess
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
-async def delete_pricing_collection(store_id: int, medicine_id: int, db, mysql_db: Session):
+async def delete_pricing_collection(store_id: int, medicine_id: int, db, mysql_db: AsyncSession):
     """
     Deleting the pricing collection in the database.
     """
     try:
         # Validate store
-        validate_store = validate_by_id(id=store_id, model=StoreDetails, field="store_id", db=mysql_db)
+        validate_store = await validate_by_id_async(id=store_id, model=StoreDetails, field="store_id", db=mysql_db)
         if validate_store == "unique":
             raise HTTPException(status_code=400, detail="Store not found")
         # Validate medicine
-        validate_medicine = validate_by_id(id=medicine_id, model=MedicineMaster, field="medicine_id", db=mysql_db)
+        validate_medicine = await validate_by_id_async(id=medicine_id, model=MedicineMaster, field="medicine_id", db=mysql_db)
         if validate_medicine == "unique":
             raise HTTPException(status_code=400, detail="Medicine not found")
 
         delete_result = await delete_pricing_collection_db(store_id=store_id, medicine_id=medicine_id, db=db)
+        await refresh_inventory_db(store_id, [medicine_id], db, mysql_db)
         return delete_result
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
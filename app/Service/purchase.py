@@ -1,13 +1,13 @@
 from fastapi import Depends, HTTPException
 from bson import ObjectId
 from typing import List
-from sqlalchemy.orm import Session
-from ..db.mysql_session import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db.mysql_session import get_async_db
 from ..db.mongodb import get_database
 from ..models.store_mongodb_models import Purchase
 import logging
-from ..crud.purchase import create_purchase_collection_db, delete_purchase_collection_db, get_all_purchases_db, get_purchases_by_id_db, get_purchases_by_date_db
-from ..utils import validate_by_id
+from ..crud.purchase import create_purchase_collection_db, delete_purchase_collection_db, get_all_purchases_db, get_purchases_by_id_db, get_purchases_by_date_db, stream_purchase_rows_db, PURCHASE_EXPORT_COLUMNS
+from ..utils import validate_by_id_async, get_export_format, parse_date_range, export_lines
 from ..models.store_mysql_models import MedicineMaster, Distributor, Manufacturer
 from datetime import datetime
 
@@ -15,7 +15,7 @@ from datetime import datetime
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-async def create_purchase_collection(purchase: Purchase, db, mysql_db: Session):
+async def create_purchase_collection(purchase: Purchase, db, mysql_db: AsyncSession):
     """
     Creating the purchase collection.
     """
@@ -27,18 +27,18 @@ async def create_purchase_collection(purchase: Purchase, db, mysql_db: Session):
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
-async def get_all_purchase_list(store_id: int, db, mysql_db: Session):
+async def get_all_purchase_list(store_id: int, db, mysql_db: AsyncSession, limit:int=None, cursor:str=None, fields:str=None):
     """
     Get all purchases
     """
     try:
-        result = await get_all_purchases_db(store_id, db, mysql_db)
+        result = await get_all_purchases_db(store_id, db, mysql_db, limit=limit, cursor=cursor, fields=fields)
         return result
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
-async def get_purchase_collection_by_id(purchase_id: str, db, mysql_db:Session):
+async def get_purchase_collection_by_id(purchase_id: str, db, mysql_db:AsyncSession):
     """
     Getting the purchase collection by id from the database.
     """
@@ -49,17 +49,26 @@ async def get_purchase_collection_by_id(purchase_id: str, db, mysql_db:Session):
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
     
-async def get_purchases_by_date_store(store_id:int, db, mysql_db:Session, start_date:str=None, end_date:str=None):
+async def get_purchases_by_date_store(store_id:int, db, mysql_db:AsyncSession, start_date:str=None, end_date:str=None, limit:int=None, cursor:str=None, fields:str=None):
     """
     Get all purchases by date and store
     """
     try:
-        result = await get_purchases_by_date_db(store_id=store_id, db=db, mysql_db=mysql_db, start_date=start_date, end_date=end_date)
+        result = await get_purchases_by_date_db(store_id=store_id, db=db, mysql_db=mysql_db, start_date=start_date, end_date=end_date, limit=limit, cursor=cursor, fields=fields)
         return result
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
+def export_purchases(store_id:int, db, start_date:str=None, end_date:str=None, export_format:str=None):
+    """
+    Export format and the line stream of the store purchases between the dates
+    """
+    export_format = get_export_format(export_format)
+    start, end = parse_date_range(start_date, end_date)
+    rows = stream_purchase_rows_db(store_id=store_id, db=db, start_date=start, end_date=end)
+    return export_format, export_lines(rows, PURCHASE_EXPORT_COLUMNS, export_format)
+
 async def delete_purchase_collection(purchase_id: str, db=Depends(get_database)):
     
     """
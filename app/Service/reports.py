@@ -0,0 +1,59 @@
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+from ..models.store_mysql_models import StoreDetails
+from ..utils import validate_by_id_async, parse_date_range
+from ..crud.reports import PERIOD_FORMATS, get_sales_report_db, get_purchase_report_db, get_order_status_report_db
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# largest top-N a report can ask for
+MAX_REPORT_TOP = 100
+
+async def validate_report(store_id: int, mysql_db: AsyncSession, period: str = "day", top: int = 10):
+    """
+    Check the store exists and the period and top-N are valid
+    """
+    if await validate_by_id_async(id=store_id, model=StoreDetails, field="store_id", db=mysql_db) == "unique":
+        raise HTTPException(status_code=400, detail="Store not found")
+    if period not in PERIOD_FORMATS:
+        raise HTTPException(status_code=400, detail="Period must be one of: " + ", ".join(PERIOD_FORMATS))
+    return max(1, min(top, MAX_REPORT_TOP))
+
+async def get_sales_report(store_id: int, db, mysql_db: AsyncSession, start_date: str = None, end_date: str = None, period: str = "day", top: int = 10):
+    """
+    Sales totals per period and the top selling medicines
+    """
+    try:
+        top = await validate_report(store_id, mysql_db, period, top)
+        start, end = parse_date_range(start_date, end_date)
+        return await get_sales_report_db(store_id, db, mysql_db, start_date=start, end_date=end, period=period, top=top)
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+async def get_purchase_report(store_id: int, db, mysql_db: AsyncSession, start_date: str = None, end_date: str = None, period: str = "day", top: int = 10):
+    """
+    Purchase spend per period and per distributor
+    """
+    try:
+        top = await validate_report(store_id, mysql_db, period, top)
+        start, end = parse_date_range(start_date, end_date)
+        return await get_purchase_report_db(store_id, db, mysql_db, start_date=start, end_date=end, period=period, top=top)
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+async def get_order_status_report(store_id: int, db, mysql_db: AsyncSession, start_date: str = None, end_date: str = None):
+    """
+    Order counts by order status
+    """
+    try:
+        await validate_report(store_id, mysql_db)
+        start, end = parse_date_range(start_date, end_date)
+        return await get_order_status_report_db(store_id, db, start_date=start, end_date=end)
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
@@ -1,19 +1,227 @@
 from fastapi import Depends, HTTPException
 from bson import ObjectId
 from typing import List
-from ..db.mongodb import get_database
+from ..db.mongodb import get_database, run_in_transaction
 from ..models.store_mongodb_models import Sale
+import asyncio
 import logging
-from ..crud.sales import create_sale_collection_db, get_sale_particular_db, read_sales_db, delete_sale_collection_db
+from ..crud.sales import write_sale_db, get_sale_particular_db, read_sales_db, delete_sale_collection_db, stream_sale_rows_db, SALE_EXPORT_COLUMNS
+from ..crud.inventory import refresh_inventory_db
+from ..crud.expiry import expiry_cutoff, is_expiring
+from ..crud.reorder import refresh_reorder_points_db
+from ..crud.batches import BATCH_COLLECTION
 from datetime import datetime
-from sqlalchemy.orm import Session
-from ..utils import create_sale_invoice
+from pymongo import UpdateOne
+from ..utils import create_sale_invoice, release_sale_invoice, get_export_format, parse_date_range, export_lines
 
 # Configure logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-async def create_sale_collection(sale: Sale, db, mysql_db: Session):
+# attempts at applying an allocation before giving up on a concurrently changing stock
+ALLOCATION_RETRIES = 3
+
+def allocate_fefo(batch_details, quantity: int, now: datetime):
+    """
+    First-expiry-first-out allocation of the quantity over the active batches.
+    Batches within the expiry horizon are skipped, the expiry sweeper deactivates them.
+    Returns the (index, taken) allocations and the quantity that could not be allocated.
+    """
+    cutoff = expiry_cutoff(now)
+    allocations = []
+    for index in sorted(range(len(batch_details)), key=lambda i: batch_details[i]["expiry_date"]):
+        if quantity <= 0:
+            break
+        batch = batch_details[index]
+        if batch.get("is_active") != 1 or is_expiring(batch, cutoff):
+            continue
+        taken = min(batch.get("batch", 0), quantity)
+        if taken > 0:
+            allocations.append((index, taken))
+            quantity -= taken
+    return allocations, quantity
+
+def allocation_update(stock, allocations, now: datetime):
+    """
+    Single guarded update applying an allocation to a stock document.
+    The filter re-checks every touched batch so the update only matches the
+    stock as it was read (optimistic concurrency).
+    Returns the query, the update and the update putting the stock back.
+    """
+    query = {"_id": stock["_id"]}
+    increments = {"available_stock": -sum(taken for _, taken in allocations)}
+    updates = {"updated_at": now}
+    for index, taken in allocations:
+        path = f"batch_details.{index}"
+        query[f"{path}.batch_number"] = stock["batch_details"][index]["batch_number"]
+        query[f"{path}.is_active"] = 1
+        query[f"{path}.batch"] = {"$gte": taken}
+        increments[f"{path}.batch"] = -taken
+    undo = {"$inc": {field: -value for field, value in increments.items()}}
+    return query, {"$inc": increments, "$set": updates}, undo
+
+async def prefetch_stocks(store_id: int, medicine_ids, db):
+    """
+    Active stocks of the medicines keyed by medicine id, read with one $in query
+    """
+    stocks = await db["stocks"].find(
+        {"store_id": store_id, "medicine_id": {"$in": list(medicine_ids)}, "active_flag": 1},
+        {"medicine_id": 1, "batch_details": 1}
+    ).to_list(length=None)
+    return {stock["medicine_id"]: stock for stock in stocks}
+
+def plan_allocations(stocks: dict, quantities: dict, now: datetime):
+    """
+    FEFO allocation of every sale line, raising before anything is written
+    when a medicine has no stock or not enough of it
+    """
+    plans = {}
+    for medicine_id, quantity in quantities.items():
+        stock = stocks.get(medicine_id)
+        if not stock:
+            raise HTTPException(status_code=404, detail=f"Stock not found for medicine {medicine_id}")
+        allocations, remaining = allocate_fefo(stock.get("batch_details", []), quantity, now)
+        if remaining > 0:
+            raise HTTPException(status_code=400, detail=f"Insufficient stock for medicine {medicine_id}")
+        plans[medicine_id] = allocation_update(stock, allocations, now)
+    return plans
+
+class StockConflict(Exception):
+    """
+    A batch changed between reading and applying an allocation
+    """
+
+async def prefetch_batches(store_id: int, medicine_ids, now: datetime, db):
+    """
+    Active stock_batches with units left of the medicines keyed by medicine id, read in
+    expiry order through the (store_id, medicine_id, expiry_date) index. The ones within
+    the expiry horizon are left to the expiry sweeper.
+    """
+    rows = await db["stock_batches"].find(
+        {
+            "store_id": store_id, "medicine_id": {"$in": list(medicine_ids)}, "is_active": 1, "batch": {"$gt": 0},
+            "expiry_date": {"$gt": expiry_cutoff(now)}
+        },
+        {"medicine_id": 1, "expiry_date": 1, "batch": 1, "is_active": 1}
+    ).sort([("medicine_id", 1), ("expiry_date", 1)]).to_list(length=None)
+    batches = {}
+    for row in rows:
+        batches.setdefault(row["medicine_id"], []).append(row)
+    return batches
+
+def batch_decrement(batch_id, taken: int, now: datetime):
+    """
+    Guarded decrement of one stock_batches document, with the update putting it back
+    """
+    return (
+        {"_id": batch_id, "is_active": 1, "batch": {"$gte": taken}},
+        {"$inc": {"batch": -taken}, "$set": {"updated_at": now}},
+        {"$inc": {"batch": taken}}
+    )
+
+async def write_guarded(collection, writes: list, session):
+    """
+    Apply the guarded (query, update, undo) writes to the collection, all of them or none.
+    Without transactions the applied ones are undone when another one no longer matches or fails.
+    """
+    if not writes:
+        return
+    if session is not None:
+        result = await collection.bulk_write([UpdateOne(query, update) for query, update, _ in writes], ordered=False, session=session)
+        if result.matched_count != len(writes):
+            raise StockConflict()
+        return
+    results = await asyncio.gather(*(collection.update_one(query, update) for query, update, _ in writes), return_exceptions=True)
+    applied = [write for write, result in zip(writes, results) if not isinstance(result, BaseException) and result.matched_count == 1]
+    if len(applied) == len(writes):
+        return
+    await undo_writes(collection, applied)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    raise StockConflict()
+
+async def undo_writes(collection, writes: list):
+    """
+    Put back guarded writes applied without a transaction
+    """
+    for query, _, undo in writes:
+        await collection.update_one({"_id": query["_id"]}, undo)
+
+async def write_sale_with_stock(stock_writes: list, batch_writes: list, sale: dict, db):
+    """
+    Apply the stock writes and insert the sale in one transaction. Without transactions
+    the applied stock writes are undone when a later write fails, the stock is only
+    taken together with its sale.
+    """
+    async def apply(session):
+        applied = []
+        try:
+            for collection, writes in ((db["stock_batches"], batch_writes), (db["stocks"], stock_writes)):
+                await write_guarded(collection, writes, session)
+                applied.append((collection, writes))
+            await write_sale_db(sale, db, session)
+        except Exception:
+            if session is None:
+                for collection, writes in reversed(applied):
+                    await undo_writes(collection, writes)
+            raise
+
+    await run_in_transaction(db, apply)
+
+async def plan_batch_sale(store_id: int, quantities: dict, db):
+    """
+    plan_sale for the stock_batches storage mode, the batch decrements
+    with the available_stock update of every medicine
+    """
+    now = datetime.now()
+    stocks, batches = await asyncio.gather(
+        prefetch_stocks(store_id, quantities, db),
+        prefetch_batches(store_id, quantities, now, db)
+    )
+    batch_writes = []
+    stock_writes = []
+    for medicine_id, quantity in quantities.items():
+        if medicine_id not in stocks:
+            raise HTTPException(status_code=404, detail=f"Stock not found for medicine {medicine_id}")
+        medicine_batches = batches.get(medicine_id, [])
+        allocations, remaining = allocate_fefo(medicine_batches, quantity, now)
+        if remaining > 0:
+            raise HTTPException(status_code=400, detail=f"Insufficient stock for medicine {medicine_id}")
+        batch_writes += [batch_decrement(medicine_batches[index]["_id"], taken, now) for index, taken in allocations]
+        stock_writes.append((
+            {"_id": stocks[medicine_id]["_id"]},
+            {"$inc": {"available_stock": -quantity}, "$set": {"updated_at": now}},
+            {"$inc": {"available_stock": quantity}}
+        ))
+    return stock_writes, batch_writes
+
+async def plan_sale(store_id: int, quantities: dict, db):
+    """
+    Read and allocate all the sale lines, raising before anything is written when the stock
+    does not cover the sale. Returns the guarded stock writes and stock_batches writes.
+    """
+    if BATCH_COLLECTION:
+        return await plan_batch_sale(store_id, quantities, db)
+    stocks = await prefetch_stocks(store_id, quantities, db)
+    return list(plan_allocations(stocks, quantities, datetime.now()).values()), []
+
+async def sell_from_stocks(store_id: int, quantities: dict, sale: dict, writes: tuple, db):
+    """
+    Apply the planned stock writes and insert the sale together.
+    The sale is re-read and re-planned when a stock changed since it was read.
+    """
+    for attempt in range(ALLOCATION_RETRIES):
+        if attempt:
+            writes = await plan_sale(store_id, quantities, db)
+        try:
+            await write_sale_with_stock(*writes, sale, db)
+            return
+        except StockConflict:
+            logger.info(f"Stock of medicines {list(quantities)} changed during the sale, retrying the allocation")
+    raise HTTPException(status_code=409, detail="Stock is being updated concurrently, please retry")
+
+async def create_sale_collection(sale: Sale, db):
     """
     Creating the sale collection in the database.
     """
@@ -21,49 +229,17 @@ async def create_sale_collection(sale: Sale, db, mysql_db: Session):
         sale_dict = sale.dict(by_alias=True)
         
         store_id = sale_dict["store_id"]
-        # Generate the invoice number
-        invoice_number = await create_sale_invoice(store_id=store_id, mysql_db=mysql_db)
-        sale_dict["invoice_number"] = invoice_number
-        
+
+        # one allocation per medicine even when it is on several lines
+        quantities = {}
         for sales in sale_dict["sale_items"]:
-            medicine_id = sales["medicine_id"]
-            quantity = sales["quantity"]
-
-            # Get the active stocks
-            stocks = await db["stocks"].find_one({"store_id": store_id, "medicine_id": medicine_id, "active_flag": 1})
-            if not stocks:
-                raise HTTPException(status_code=404, detail="Stock not found")
-
-            # Sort the batches by expiry date
-            batches = sorted(stocks["batch_details"], key=lambda x: x["expiry_date"])
-            
-            # Get the batch by batch
-            for batch in batches:
-                
-                # checking the batch is expired or the medicine will expired in one month (30 days)
-                if batch["expiry_date"] < datetime.now() or (batch["expiry_date"] - datetime.now()).days <= 30:
-                    # Update the batch if the medicine is expired or going to expire in 30 days
-                    await db["stocks"].update_one(
-                        {"store_id": store_id, "medicine_id": medicine_id, "batch_details.batch_number": batch["batch_number"]},
-                        {"$set": {"batch_details.$.is_active": 0}}
-                    )
-                else:
-                    if batch["is_active"] == 1:
-                        if quantity > batch["units_in_pack"]:
-                            quantity -= batch["units_in_pack"]
-                            # Update the stock
-                            await db["stocks"].update_one(
-                                {"store_id": store_id, "medicine_id": medicine_id, "batch_details.batch_number": batch["batch_number"]},
-                                {"$set": {"batch_details.$.units_in_pack": 0, "updated_at": datetime.now()}}
-                            )
-                        else:
-                            # Update the stock
-                            await db["stocks"].update_one(
-                                {"store_id": store_id, "medicine_id": medicine_id, "batch_details.batch_number": batch["batch_number"]},
-                                {"$set": {"batch_details.$.units_in_pack": batch["units_in_pack"] - quantity, "updated_at": datetime.now()}}
-                            )
-                            quantity = 0
-                            break
+            quantities[sales["medicine_id"]] = quantities.get(sales["medicine_id"], 0) + sales["quantity"]
+
+        writes = await plan_sale(store_id=store_id, quantities=quantities, db=db)
+
+        # Generate the invoice number once the stock covers the sale, so a rejected sale takes no number
+        invoice_number = await create_sale_invoice(store_id=store_id)
+        sale_dict["invoice_number"] = invoice_number
 
         result = {
             "store_id": sale_dict["store_id"],
@@ -76,23 +252,38 @@ async def create_sale_collection(sale: Sale, db, mysql_db: Session):
             "active_flag": 1,
             "sale_items": sale_dict["sale_items"]
         }
-        sales_result = await create_sale_collection_db(sale=result, db=db)
-        return sales_result
+        try:
+            await sell_from_stocks(store_id=store_id, quantities=quantities, sale=result, writes=writes, db=db)
+        except Exception:
+            await release_sale_invoice(store_id=store_id, invoice_number=invoice_number, db=db)
+            raise
+        await refresh_inventory_db(store_id, list(quantities), db)
+        await refresh_reorder_points_db(store_id, db, list(quantities))
+        return result
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
-async def get_sales(store_id:int, db):
+async def get_sales(store_id:int, db, limit:int=None, cursor:str=None, fields:str=None):
     """
     Get the sale by store
     """
     try:
-        sales = await read_sales_db(store_id=store_id, db=db)
+        sales = await read_sales_db(store_id=store_id, db=db, limit=limit, cursor=cursor, fields=fields)
         return sales
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
+def export_sales(store_id:int, db, start_date:str=None, end_date:str=None, export_format:str=None):
+    """
+    Export format and the line stream of the store sales between the dates
+    """
+    export_format = get_export_format(export_format)
+    start, end = parse_date_range(start_date, end_date)
+    rows = stream_sale_rows_db(store_id=store_id, db=db, start_date=start, end_date=end)
+    return export_format, export_lines(rows, SALE_EXPORT_COLUMNS, export_format)
+
 async def get_sale_particular(sale_id: str, db):
     """
     Get the sale particular
@@ -4,19 +4,22 @@ from typing import List
 from ..db.mongodb import get_database
 from ..models.store_mongodb_models import Stock
 import logging
-from sqlalchemy.orm import Session
-from ..db.mysql_session import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db.mysql_session import get_async_db
 from ..models.store_mysql_models import MedicineMaster, StoreDetails
 from bson import ObjectId
 from datetime import datetime
-from ..utils import validate_by_id
+from ..utils import validate_by_id_async
+from ..crud.inventory import refresh_inventory_db
+from ..crud.expiry import get_expiring_batches_db, EXPIRY_HORIZON_DAYS
+from ..crud.reorder import get_reorder_points_db
 from ..crud.stock import create_stock_collection_db, get_all_stocks_by_store_db, get_stock_collection_by_id_db, delete_stock_collection_db
 
 # Configure logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-async def create_stock_collection(stock: Stock, db, mysql_db:Session):
+async def create_stock_collection(stock: Stock, db, mysql_db:AsyncSession):
     """
     Creating the stock collection in the database.
     """
@@ -24,10 +27,10 @@ async def create_stock_collection(stock: Stock, db, mysql_db:Session):
         stock_dict = stock.dict(by_alias=True)
         
         #validate_store_id
-        if validate_by_id(id=stock_dict["store_id"], model=StoreDetails, field="store_id", db=mysql_db) == "unique":
+        if await validate_by_id_async(id=stock_dict["store_id"], model=StoreDetails, field="store_id", db=mysql_db) == "unique":
             raise HTTPException(status_code=400, detail="Store not found")
         #validate_medicine_id
-        if validate_by_id(id=stock_dict["medicine_id"], model=MedicineMaster, field="medicine_id", db=mysql_db) == "unique":
+        if await validate_by_id_async(id=stock_dict["medicine_id"], model=MedicineMaster, field="medicine_id", db=mysql_db) == "unique":
             raise HTTPException(status_code=400, detail="Medicine not found")
         stocks = {
             "store_id": stock_dict["store_id"],
@@ -48,23 +51,51 @@ async def create_stock_collection(stock: Stock, db, mysql_db:Session):
             ]
         }
         result = await create_stock_collection_db(stocks=stocks, db=db)
+        await refresh_inventory_db(stocks["store_id"], [stocks["medicine_id"]], db, mysql_db)
         return result
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
-async def get_all_stocks_by_store(store_id: int, db, mysql_db:Session):
+async def get_all_stocks_by_store(store_id: int, db, mysql_db:AsyncSession, limit:int=None, cursor:str=None, fields:str=None):
     """
     Get all stocks by store id.
     """
     try:
-        result = await get_all_stocks_by_store_db(store_id=store_id, db=db, mysql_db=mysql_db)
+        result = await get_all_stocks_by_store_db(store_id=store_id, db=db, mysql_db=mysql_db, limit=limit, cursor=cursor, fields=fields)
         return result
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
-async def get_stock_collection_by_id(store_id:int, medicine_id:int, db, mysql_db:Session):
+async def get_expiring_batches(store_id: int, db, mysql_db: AsyncSession, days: int = None):
+    """
+    Batches of the store expiring within the days, the expiry horizon by default.
+    """
+    try:
+        if await validate_by_id_async(id=store_id, model=StoreDetails, field="store_id", db=mysql_db) == "unique":
+            raise HTTPException(status_code=400, detail="Store not found")
+        days = EXPIRY_HORIZON_DAYS if days is None else days
+        if days < 0:
+            raise HTTPException(status_code=400, detail="days must not be negative")
+        return await get_expiring_batches_db(store_id=store_id, days=days, db=db, mysql_db=mysql_db)
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+async def get_reorder_points(store_id: int, db, mysql_db: AsyncSession, below_only: bool = True, limit: int = None, cursor: str = None):
+    """
+    Reorder points of the store, only the medicines at or below them by default.
+    """
+    try:
+        if await validate_by_id_async(id=store_id, model=StoreDetails, field="store_id", db=mysql_db) == "unique":
+            raise HTTPException(status_code=400, detail="Store not found")
+        return await get_reorder_points_db(store_id=store_id, db=db, mysql_db=mysql_db, below_only=below_only, limit=limit, cursor=cursor)
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+async def get_stock_collection_by_id(store_id:int, medicine_id:int, db, mysql_db:AsyncSession):
     """
     Getting the stock collection by id from the database.
     """
@@ -0,0 +1,163 @@
+from pymongo import ReplaceOne
+from datetime import datetime
+from typing import Optional
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from ..db.mongodb import get_database, run_in_transaction
+from ..db.indexes import INDEXES
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# where the stock batches live: "embedded" in stocks.batch_details, or "collection"
+# for one stock_batches document per batch, migrate the batches before switching
+STOCK_BATCH_STORAGE = os.getenv("STOCK_BATCH_STORAGE", "embedded").lower()
+BATCH_COLLECTION = STOCK_BATCH_STORAGE == "collection"
+# batches archived or stocks migrated per round trip
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "500"))
+
+# nothing left in the batch or it was deactivated, it is never sold again
+DEPLETED_BATCH = {"$or": [{"batch": {"$lte": 0}}, {"is_active": 0}]}
+
+def batch_documents(store_id: int, medicine_id: int, batch_details: list, now: datetime):
+    """
+    stock_batches documents of embedded batch entries
+    """
+    return [
+        {"store_id": store_id, "medicine_id": medicine_id, **batch, "created_at": now, "updated_at": now}
+        for batch in batch_details
+    ]
+
+def is_depleted(batch: dict):
+    """
+    DEPLETED_BATCH on an embedded entry, entries without a batch quantity are kept like the query does
+    """
+    return ("batch" in batch and batch["batch"] <= 0) or batch.get("is_active") == 0
+
+async def get_batches_db(store_id: int, medicine_ids, db, active_only: bool = False):
+    """
+    Batches of the medicines keyed by medicine id, soonest expiry first,
+    read from wherever the storage mode keeps them
+    """
+    medicine_ids = list(set(medicine_ids))
+    batches = {}
+    if BATCH_COLLECTION:
+        query = {"store_id": store_id, "medicine_id": {"$in": medicine_ids}}
+        if active_only:
+            query["is_active"] = 1
+        rows = await db.stock_batches.find(query).sort([("medicine_id", 1), ("expiry_date", 1)]).to_list(length=None)
+        for row in rows:
+            batches.setdefault(row["medicine_id"], []).append(row)
+        return batches
+    stocks = await db.stocks.find(
+        {"store_id": store_id, "medicine_id": {"$in": medicine_ids}},
+        {"medicine_id": 1, "batch_details": 1}
+    ).to_list(length=None)
+    for stock in stocks:
+        batches.setdefault(stock["medicine_id"], []).extend(
+            batch for batch in stock.get("batch_details") or [] if not active_only or batch.get("is_active") == 1
+        )
+    for medicine_batches in batches.values():
+        medicine_batches.sort(key=lambda batch: batch["expiry_date"])
+    return batches
+
+async def move_stock_batches(stock: dict, batches: list, update: dict, target, db):
+    """
+    Copy the batches of a stock into the target collection, then apply the update to the stock
+    if it did not change since it was read. Without transactions the copies are removed again
+    when the stock changed, so a stock is moved completely or not at all.
+    """
+    documents = batch_documents(stock["store_id"], stock["medicine_id"], batches, datetime.now())
+
+    async def move(session):
+        inserted = await target.insert_many(documents, session=session)
+        result = await db.stocks.update_one({"_id": stock["_id"], "updated_at": stock.get("updated_at")}, update, session=session)
+        if result.matched_count != 1:
+            if session is None:
+                await target.delete_many({"_id": {"$in": inserted.inserted_ids}})
+                return False
+            await session.abort_transaction()
+            return False
+        return True
+
+    return await run_in_transaction(db, move)
+
+async def migrate_batches_db(db, store_id: Optional[int] = None):
+    """
+    Move the embedded batch_details of the stocks into stock_batches.
+    Stocks written during the migration are skipped, run it again until nothing is left.
+    """
+    await db.stock_batches.create_indexes(INDEXES["stock_batches"])
+    query = {"batch_details.0": {"$exists": True}}
+    if store_id is not None:
+        query["store_id"] = store_id
+    moved = 0
+    skipped = 0
+    async for stock in db.stocks.find(query, {"store_id": 1, "medicine_id": 1, "batch_details": 1, "updated_at": 1}):
+        update = {"$set": {"batch_details": [], "updated_at": datetime.now()}}
+        if await move_stock_batches(stock, stock["batch_details"], update, db.stock_batches, db):
+            moved += 1
+        else:
+            skipped += 1
+    logger.info(f"Batches of {moved} stocks moved to stock_batches, {skipped} stocks changed during the migration")
+    return moved
+
+async def compact_batches_db(db, store_id: Optional[int] = None):
+    """
+    Archive the depleted batches into stock_batches_archive and drop them from the live batches,
+    stock_batches or stocks.batch_details depending on the storage mode
+    """
+    await db.stock_batches_archive.create_indexes(INDEXES["stock_batches_archive"])
+    query = {"store_id": store_id} if store_id is not None else {}
+    archived = 0
+    if BATCH_COLLECTION:
+        cursor = db.stock_batches.find({**query, **DEPLETED_BATCH}).batch_size(BATCH_CHUNK_SIZE)
+        chunk = []
+        async for batch in cursor:
+            chunk.append(batch)
+            if len(chunk) >= BATCH_CHUNK_SIZE:
+                archived += await archive_batch_documents(chunk, db)
+                chunk = []
+        if chunk:
+            archived += await archive_batch_documents(chunk, db)
+    else:
+        query["batch_details"] = {"$elemMatch": DEPLETED_BATCH}
+        async for stock in db.stocks.find(query, {"store_id": 1, "medicine_id": 1, "batch_details": 1, "updated_at": 1}):
+            depleted = [batch for batch in stock["batch_details"] if is_depleted(batch)]
+            update = {"$pull": {"batch_details": DEPLETED_BATCH}, "$set": {"updated_at": datetime.now()}}
+            if await move_stock_batches(stock, depleted, update, db.stock_batches_archive, db):
+                archived += len(depleted)
+    logger.info(f"{archived} depleted batches archived")
+    return archived
+
+async def archive_batch_documents(batches: list, db):
+    """
+    Copy stock_batches documents into the archive under the same _id, then delete them.
+    Replacing by _id keeps a re-run after a failure from archiving a batch twice.
+    """
+    now = datetime.now()
+    await db.stock_batches_archive.bulk_write(
+        [ReplaceOne({"_id": batch["_id"]}, {**batch, "archived_at": now}, upsert=True) for batch in batches],
+        ordered=False
+    )
+    # a depleted batch is never written again, the condition only guards against a wrong read
+    result = await db.stock_batches.delete_many({"_id": {"$in": [batch["_id"] for batch in batches]}, **DEPLETED_BATCH})
+    return result.deleted_count
+
+async def main(argv):
+    parser = argparse.ArgumentParser(description="Migrate the stock batches to stock_batches or archive the depleted ones")
+    parser.add_argument("command", choices=["migrate", "compact"])
+    parser.add_argument("--store", type=int, help="only this store")
+    args = parser.parse_args(argv)
+    if args.command == "migrate":
+        await migrate_batches_db(get_database(), args.store)
+    else:
+        await compact_batches_db(get_database(), args.store)
+
+if __name__ == "__main__":
+    # python -m istore.app.crud.batches migrate|compact [--store N]
+    asyncio.run(main(sys.argv[1:]))
@@ -2,6 +2,7 @@ from fastapi import Depends, HTTPException
 from sqlalchemy.orm import Session
 from istore.app.models.store_mysql_models import Category as CategoryModel
 from istore.app.schemas.CaregorySchema import Category as CategorySchema, CategoryCreate
+from istore.app.utils import invalidate_master_cache
 import logging
 from typing import List
 from datetime import datetime
@@ -19,6 +20,7 @@ def creating_category_record_db(db_category, db: Session):
         db.add(db_category)
         db.commit()
         db.refresh(db_category)
+        invalidate_master_cache(CategoryModel)
         return db_category
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
@@ -73,6 +75,7 @@ def update_category_record_db(category_name: str, category: CategoryCreate, db:
         db_category.updated_at = datetime.now()
         db.commit()
         db.refresh(db_category)
+        invalidate_master_cache(CategoryModel)
         return db_category
     except Exception as e:
         db.rollback()
@@ -91,6 +94,7 @@ def activate_category_record_db(category_name, active_flag, db:Session):
         db_category.updated_at = datetime.now()
         db.commit()
         db.refresh(db_category)
+        invalidate_master_cache(CategoryModel)
         return db_category
     except Exception as e:
         db.rollback()
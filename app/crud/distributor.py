@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from ..models.store_mysql_models import Distributor as DistributorModel
 from ..schemas.DistributorSchema import Distributor as DistributorSchema, DistributorCreate, UpdateDistributorRecord
+from ..utils import invalidate_master_cache
 import logging
 from typing import List
 from datetime import datetime
@@ -20,6 +21,7 @@ def creating_distributor_record_db(db_distributor, db: Session):
         db.add(db_distributor)
         db.commit()
         db.refresh(db_distributor)
+        invalidate_master_cache(DistributorModel)
         return db_distributor
     except SQLAlchemyError as e:
         logger.error(f"Database error: {str(e)}")
@@ -72,6 +74,7 @@ def update_distributor_record_db(distributor_name: str, distributor: UpdateDistr
         db_distributor.updated_at = datetime.now()
         db.commit()
         db.refresh(db_distributor)
+        invalidate_master_cache(DistributorModel)
         return db_distributor
     except SQLAlchemyError as e:
         db.rollback()
@@ -90,6 +93,7 @@ def activate_distributor_record_db(distributor_name, active_flag, db:Session):
         db_distributor.updated_at = datetime.now()
         db.commit()
         db.refresh(db_distributor)
+        invalidate_master_cache(DistributorModel)
         return db_distributor
     except Exception as e:
         db.rollback()
@@ -0,0 +1,197 @@
+from fastapi import HTTPException
+from pymongo import UpdateOne
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+import sys
+from ..db.mongodb import get_database
+from ..models.store_mysql_models import MedicineMaster
+from ..utils import get_names_by_ids_async
+from .inventory import refresh_inventory_db
+from .reorder import refresh_reorder_points_db
+from .batches import BATCH_COLLECTION
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# batches expiring within this many days are deactivated and not sold any more
+EXPIRY_HORIZON_DAYS = int(os.getenv("EXPIRY_HORIZON_DAYS", "30"))
+# seconds between two sweeps of the background task, 0 turns it off
+EXPIRY_SWEEP_INTERVAL = int(os.getenv("EXPIRY_SWEEP_INTERVAL", "3600"))
+# stock updates sent per bulk_write
+EXPIRY_SWEEP_BATCH_SIZE = int(os.getenv("EXPIRY_SWEEP_BATCH_SIZE", "500"))
+
+def expiry_cutoff(now: datetime, days: int = EXPIRY_HORIZON_DAYS):
+    """
+    Batches expiring on or before the cutoff are within the horizon
+    """
+    return now + timedelta(days=days)
+
+def is_expiring(batch: dict, cutoff: datetime):
+    return batch.get("is_active") == 1 and batch.get("expiry_date") is not None and batch["expiry_date"] <= cutoff
+
+def expiring_stocks_query(cutoff: datetime, store_id: int = None):
+    """
+    Stocks holding an active batch within the horizon, served by the batch_details.expiry_date index
+    """
+    query = {"batch_details": {"$elemMatch": {"expiry_date": {"$lte": cutoff}, "is_active": 1}}}
+    if store_id is not None:
+        query["store_id"] = store_id
+    return query
+
+def deactivation_update(stock: dict, cutoff: datetime, now: datetime):
+    """
+    Deactivate the expiring batches of a stock and take their units out of available_stock.
+    The filter re-checks updated_at so a stock written since it was read is left for the next sweep.
+    """
+    removed = sum(batch.get("batch", 0) for batch in stock.get("batch_details", []) if is_expiring(batch, cutoff))
+    return UpdateOne(
+        {"_id": stock["_id"], "updated_at": stock.get("updated_at")},
+        {
+            "$set": {"batch_details.$[expiring].is_active": 0, "updated_at": now},
+            "$inc": {"available_stock": -removed}
+        },
+        array_filters=[{"expiring.is_active": 1, "expiring.expiry_date": {"$lte": cutoff}}]
+    )
+
+async def deactivate_embedded_batches_db(db, cutoff: datetime, now: datetime, store_id: int, touched: dict):
+    """
+    Deactivate the expiring stocks.batch_details entries with bulk arrayFilters updates.
+    Returns the number of stocks found and updated.
+    """
+    cursor = db.stocks.find(
+        expiring_stocks_query(cutoff, store_id),
+        {"store_id": 1, "medicine_id": 1, "batch_details": 1, "updated_at": 1}
+    )
+    found = 0
+    updated = 0
+    operations = []
+    async for stock in cursor:
+        found += 1
+        operations.append(deactivation_update(stock, cutoff, now))
+        touched.setdefault(stock["store_id"], set()).add(stock["medicine_id"])
+        if len(operations) >= EXPIRY_SWEEP_BATCH_SIZE:
+            updated += (await db.stocks.bulk_write(operations, ordered=False)).modified_count
+            operations = []
+    if operations:
+        updated += (await db.stocks.bulk_write(operations, ordered=False)).modified_count
+    return found, updated
+
+async def deactivate_batch_documents_db(db, cutoff: datetime, now: datetime, store_id: int, touched: dict):
+    """
+    Deactivate the expiring stock_batches documents one by one, each deactivation returns the
+    units left at that moment, which are then taken out of available_stock.
+    Returns the number of stocks found and updated.
+    """
+    query = {"is_active": 1, "expiry_date": {"$lte": cutoff}}
+    if store_id is not None:
+        query["store_id"] = store_id
+    batch_ids = [batch["_id"] for batch in await db.stock_batches.find(query, {"_id": 1}).to_list(length=None)]
+    removed = {}
+    for start in range(0, len(batch_ids), EXPIRY_SWEEP_BATCH_SIZE):
+        deactivated = await asyncio.gather(*(
+            db.stock_batches.find_one_and_update(
+                {"_id": batch_id, "is_active": 1},
+                {"$set": {"is_active": 0, "updated_at": now}},
+                projection={"store_id": 1, "medicine_id": 1, "batch": 1}
+            )
+            for batch_id in batch_ids[start:start + EXPIRY_SWEEP_BATCH_SIZE]
+        ))
+        for batch in deactivated:
+            # sold out or deactivated since it was read
+            if batch is None:
+                continue
+            key = (batch["store_id"], batch["medicine_id"])
+            removed[key] = removed.get(key, 0) + max(batch.get("batch", 0), 0)
+    operations = [
+        UpdateOne({"store_id": key[0], "medicine_id": key[1]}, {"$inc": {"available_stock": -units}, "$set": {"updated_at": now}})
+        for key, units in removed.items()
+    ]
+    updated = 0
+    for start in range(0, len(operations), EXPIRY_SWEEP_BATCH_SIZE):
+        updated += (await db.stocks.bulk_write(operations[start:start + EXPIRY_SWEEP_BATCH_SIZE], ordered=False)).modified_count
+    for touched_store, medicine_id in removed:
+        touched.setdefault(touched_store, set()).add(medicine_id)
+    return len(removed), updated
+
+async def sweep_expiring_batches_db(db, days: int = EXPIRY_HORIZON_DAYS, store_id: int = None):
+    """
+    Deactivate every active batch expiring within the horizon, then refresh the
+    inventory_view rows and reorder points of the touched stocks.
+    Returns the number of stocks updated.
+    """
+    now = datetime.now()
+    cutoff = expiry_cutoff(now, days)
+    touched = {}
+    deactivate = deactivate_batch_documents_db if BATCH_COLLECTION else deactivate_embedded_batches_db
+    found, updated = await deactivate(db, cutoff, now, store_id, touched)
+    for touched_store, medicine_ids in touched.items():
+        await refresh_inventory_db(touched_store, medicine_ids, db)
+        await refresh_reorder_points_db(touched_store, db, medicine_ids)
+    if found:
+        logger.info(f"Expiry sweep: {updated} of {found} stocks updated, batches expiring by {cutoff:%Y-%m-%d} deactivated")
+    return updated
+
+async def run_expiry_sweeper(db, interval: int = EXPIRY_SWEEP_INTERVAL):
+    """
+    Background task sweeping the expiring batches every interval seconds until it is cancelled
+    """
+    while True:
+        try:
+            await sweep_expiring_batches_db(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Expiry sweep failed: {str(e)}")
+        await asyncio.sleep(interval)
+
+async def get_expiring_batches_db(store_id: int, days: int, db, mysql_db: AsyncSession):
+    """
+    Active batches of the store expiring within the days, soonest first
+    """
+    try:
+        now = datetime.now()
+        cutoff = expiry_cutoff(now, days)
+        if BATCH_COLLECTION:
+            batches = await db.stock_batches.find(
+                {"store_id": store_id, "is_active": 1, "expiry_date": {"$lte": cutoff}},
+                {"_id": 0, "medicine_id": 1, "batch_number": 1, "expiry_date": 1, "batch": 1}
+            ).sort([("expiry_date", 1), ("medicine_id", 1)]).to_list(length=None)
+            rows = [
+                {"medicine_id": batch["medicine_id"], "batch_number": batch["batch_number"], "expiry_date": batch["expiry_date"], "quantity": batch["batch"]}
+                for batch in batches
+            ]
+        else:
+            rows = await db.stocks.aggregate([
+                {"$match": {"active_flag": 1, **expiring_stocks_query(cutoff, store_id)}},
+                {"$unwind": "$batch_details"},
+                {"$match": {"batch_details.is_active": 1, "batch_details.expiry_date": {"$lte": cutoff}}},
+                {"$project": {
+                    "_id": 0, "medicine_id": 1, "batch_number": "$batch_details.batch_number",
+                    "expiry_date": "$batch_details.expiry_date", "quantity": "$batch_details.batch"
+                }},
+                {"$sort": {"expiry_date": 1, "medicine_id": 1}}
+            ]).to_list(length=None)
+        names = await get_names_by_ids_async(ids={row["medicine_id"] for row in rows}, model=MedicineMaster, field="medicine_id", name_field="medicine_name", db=mysql_db)
+        return {
+            "store_id": store_id,
+            "days": days,
+            "batches": [
+                {**row, "medicine_name": names.get(row["medicine_id"]), "days_left": (row["expiry_date"] - now).days}
+                for row in rows
+            ]
+        }
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+async def main(argv):
+    days = int(argv[0]) if argv else EXPIRY_HORIZON_DAYS
+    await sweep_expiring_batches_db(get_database(), days)
+
+if __name__ == "__main__":
+    # python -m istore.app.crud.expiry [horizon_days]
+    asyncio.run(main(sys.argv[1:]))
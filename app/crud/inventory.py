@@ -0,0 +1,212 @@
+from pymongo import UpdateOne, DeleteOne
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from datetime import datetime
+import asyncio
+import logging
+import sys
+from ..db.mongodb import get_database
+from ..db.mysql import AsyncSessionLocal
+from ..models.store_mysql_models import MedicineMaster, Manufacturer, Category, StoreDetails
+from ..utils import get_name_by_id_async
+from .batches import BATCH_COLLECTION
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# medicines refreshed per round trip by the rebuild
+REBUILD_CHUNK_SIZE = 500
+
+async def get_medicine_details_by_ids(medicine_ids, mysql_db: AsyncSession):
+    """
+    Medicine, manufacturer and category names for a set of medicines in one query
+    """
+    if not medicine_ids:
+        return {}
+    rows = await mysql_db.execute(
+        select(
+            MedicineMaster.medicine_id,
+            MedicineMaster.medicine_name,
+            MedicineMaster.composition,
+            Manufacturer.manufacturer_name,
+            Category.category_name
+        )
+        .outerjoin(Manufacturer, Manufacturer.manufacturer_id == MedicineMaster.manufacturer_id)
+        .outerjoin(Category, Category.category_id == MedicineMaster.category_id)
+        .where(MedicineMaster.medicine_id.in_(set(medicine_ids)))
+    )
+    return {
+        row.medicine_id: {
+            "medicine_name": row.medicine_name,
+            "composition": row.composition,
+            "manufacturer_name": row.manufacturer_name,
+            "category_name": row.category_name
+        }
+        for row in rows.all()
+    }
+
+def last_package_pipeline(store_id: int, medicine_ids: list):
+    """
+    Pack details of the latest purchase line of each medicine
+    """
+    return [
+        {"$match": {"store_id": store_id, "active_flag": 1, "purchase_items.medicine_id": {"$in": medicine_ids}}},
+        {"$unwind": "$purchase_items"},
+        {"$match": {"purchase_items.medicine_id": {"$in": medicine_ids}}},
+        {"$sort": {"purchase_date": -1, "_id": -1}},
+        {"$group": {
+            "_id": "$purchase_items.medicine_id",
+            "packets": {"$first": "$purchase_items.units_per_package_type"},
+            "units": {"$first": "$purchase_items.packagetype_quantity"}
+        }}
+    ]
+
+def earliest_batch(batch_details):
+    """
+    Active batch with stock left that expires first
+    """
+    batches = [batch for batch in batch_details or [] if batch.get("is_active") == 1 and batch.get("batch", 0) > 0]
+    if not batches:
+        return None
+    batch = min(batches, key=lambda batch: batch["expiry_date"])
+    return {"batch_number": batch["batch_number"], "expiry_date": batch["expiry_date"], "quantity": batch["batch"]}
+
+def earliest_batch_pipeline(store_id: int, medicine_ids: list):
+    """
+    First expiring active batch with stock left of each medicine, from stock_batches
+    """
+    return [
+        {"$match": {"store_id": store_id, "medicine_id": {"$in": medicine_ids}, "is_active": 1, "batch": {"$gt": 0}}},
+        {"$sort": {"medicine_id": 1, "expiry_date": 1}},
+        {"$group": {"_id": "$medicine_id", "batch": {"$first": "$$ROOT"}}}
+    ]
+
+async def get_row_names(store_id: int, medicine_ids, mysql_db: AsyncSession):
+    """
+    Medicine details and store name of inventory_view rows
+    """
+    names = await get_medicine_details_by_ids(medicine_ids, mysql_db)
+    store_name = await get_name_by_id_async(id=store_id, model=StoreDetails, field="store_id", name_field="store_name", db=mysql_db)
+    return names, store_name
+
+async def refresh_inventory_db(store_id: int, medicine_ids, db, mysql_db: Optional[AsyncSession] = None):
+    """
+    Recompute the inventory_view rows of the medicines from stocks, pricing and purchases.
+    Names are refreshed when a MySQL session is given, otherwise the stored ones are kept
+    and only the rows without names yet are resolved, with a session of their own.
+    Failures are logged and left for the rebuild, the source write has already happened.
+    """
+    medicine_ids = list(set(medicine_ids))
+    if not medicine_ids:
+        return 0
+    try:
+        readers = [
+            db.stocks.find(
+                {"store_id": store_id, "medicine_id": {"$in": medicine_ids}},
+                {"medicine_id": 1, "available_stock": 1, "active_flag": 1, "batch_details": 1}
+            ).to_list(length=None),
+            db.pricing.find(
+                {"store_id": store_id, "medicine_id": {"$in": medicine_ids}, "active_flag": 1},
+                {"medicine_id": 1, "price": 1, "discount": 1, "net_rate": 1}
+            ).to_list(length=None),
+            db.purchases.aggregate(last_package_pipeline(store_id, medicine_ids)).to_list(length=None),
+            db.inventory_view.find(
+                {"store_id": store_id, "medicine_id": {"$in": medicine_ids}, "medicine_name": {"$exists": True}},
+                {"medicine_id": 1}
+            ).to_list(length=None)
+        ]
+        if BATCH_COLLECTION:
+            readers.append(db.stock_batches.aggregate(earliest_batch_pipeline(store_id, medicine_ids)).to_list(length=None))
+        stocks, pricings, packages, named, *batch_rows = await asyncio.gather(*readers)
+        stock_by_medicine = {}
+        for stock in stocks:
+            stock_by_medicine.setdefault(stock["medicine_id"], stock)
+        if BATCH_COLLECTION:
+            batches_by_medicine = {row["_id"]: [row["batch"]] for row in batch_rows[0]}
+        else:
+            batches_by_medicine = {medicine_id: stock.get("batch_details") for medicine_id, stock in stock_by_medicine.items()}
+        pricing_by_medicine = {}
+        for pricing in pricings:
+            pricing_by_medicine.setdefault(pricing["medicine_id"], pricing)
+        package_by_medicine = {package["_id"]: package for package in packages}
+
+        names = {}
+        store_name = None
+        if mysql_db is not None:
+            names, store_name = await get_row_names(store_id, medicine_ids, mysql_db)
+        else:
+            # a row written for the first time gets its names even without the request session
+            named_ids = {row["medicine_id"] for row in named}
+            unnamed = [medicine_id for medicine_id in stock_by_medicine if medicine_id not in named_ids]
+            if unnamed:
+                async with AsyncSessionLocal() as session:
+                    names, store_name = await get_row_names(store_id, unnamed, session)
+
+        operations = []
+        for medicine_id in medicine_ids:
+            key = {"store_id": store_id, "medicine_id": medicine_id}
+            stock = stock_by_medicine.get(medicine_id)
+            if not stock or stock.get("active_flag") == 0:
+                operations.append(DeleteOne(key))
+                continue
+            pricing = pricing_by_medicine.get(medicine_id) or {}
+            package = package_by_medicine.get(medicine_id) or {}
+            row = {
+                "Is_stock": "In Stock" if stock["available_stock"] > 0 else "Not In Stock",
+                "packets": package.get("packets"),
+                "units": package.get("units"),
+                "available_stock": stock["available_stock"],
+                "mrp": pricing.get("price"),
+                "discount": pricing.get("discount"),
+                "net_rate": pricing.get("net_rate"),
+                "earliest_batch": earliest_batch(batches_by_medicine.get(medicine_id)),
+                "updated_at": datetime.now()
+            }
+            medicine = names.get(medicine_id)
+            if medicine:
+                row.update({
+                    "store_name": store_name,
+                    "medicine_name": medicine["medicine_name"],
+                    "manufacturer_name": medicine["manufacturer_name"],
+                    "composition": medicine["composition"],
+                    "category": medicine["category_name"]
+                })
+            operations.append(UpdateOne(key, {"$set": row}, upsert=True))
+        await db.inventory_view.bulk_write(operations, ordered=False)
+        return len(operations)
+    except Exception as e:
+        logger.error(f"Error refreshing the inventory view of store {store_id}: {str(e)}")
+        return 0
+
+async def get_inventory_page_db(query: dict, projection: Optional[dict], limit: int, db):
+    """
+    Page of inventory_view rows ordered by _id
+    """
+    return await db.inventory_view.find(query, projection).sort("_id", 1).limit(limit + 1).to_list(length=None)
+
+async def rebuild_inventory_view_db(db, mysql_db: AsyncSession, store_id: Optional[int] = None):
+    """
+    Regenerate inventory_view from the source collections, for one store or all of them
+    """
+    store_ids = [store_id] if store_id is not None else await db.stocks.distinct("store_id")
+    refreshed = 0
+    for store in store_ids:
+        medicine_ids = await db.stocks.distinct("medicine_id", {"store_id": store})
+        # drop the rows of medicines that no longer have a stock document
+        await db.inventory_view.delete_many({"store_id": store, "medicine_id": {"$nin": medicine_ids}})
+        for start in range(0, len(medicine_ids), REBUILD_CHUNK_SIZE):
+            refreshed += await refresh_inventory_db(store, medicine_ids[start:start + REBUILD_CHUNK_SIZE], db, mysql_db)
+        logger.info(f"Inventory view rebuilt for store {store}")
+    return refreshed
+
+async def main(argv):
+    store_id = int(argv[0]) if argv else None
+    async with AsyncSessionLocal() as mysql_db:
+        refreshed = await rebuild_inventory_view_db(get_database(), mysql_db, store_id)
+    logger.info(f"Inventory view rebuilt, {refreshed} rows refreshed")
+
+if __name__ == "__main__":
+    # python -m istore.app.crud.inventory [store_id]
+    asyncio.run(main(sys.argv[1:]))
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from ..db.mysql import get_db
 from ..models.store_mysql_models import Manufacturer as ManufacturerModel
 from ..schemas.ManufacturerSchema import Manufacturer as ManufacturerSchema, ManufacturerCreate, UpdateManufacturer
+from ..utils import invalidate_master_cache
 import logging
 from typing import List
 from datetime import datetime
@@ -19,6 +20,7 @@ def create_manufacturer_record_db(db_manufacturer, db: Session = get_db):
         db.add(db_manufacturer)
         db.commit()
         db.refresh(db_manufacturer)
+        invalidate_master_cache(ManufacturerModel)
         return db_manufacturer
     except Exception as e:
         logger.error(f"Error creating manufacturer record: {e}")
@@ -73,6 +75,7 @@ def update_manufacturer_record_db(manufacturer_name: str, manufacturer: UpdateMa
         db_manufacturer.updated_at = datetime.now()
         db.commit()
         db.refresh(db_manufacturer)
+        invalidate_master_cache(ManufacturerModel)
         return db_manufacturer
     except Exception as e:
         db.rollback()
@@ -91,6 +94,7 @@ def activate_manufacturer_record_db(manufacturer_name, active_flag, db:Session):
         db_manufacturer.updated_at = datetime.now()
         db.commit()
         db.refresh(db_manufacturer)
+        invalidate_master_cache(ManufacturerModel)
         return db_manufacturer
     except Exception as e:
         logger.error(f"Error updating manufacturer record: {e}")
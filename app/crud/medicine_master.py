@@ -4,6 +4,7 @@ from typing import List
 from ..db.mysql_session import get_db
 from ..models.store_mysql_models import MedicineMaster as MedicineMasterModel 
 from ..schemas.MedicinemasterSchema import MedicineMaster as MedicineMasterSchema, MedicineMasterCreate, UpdateMedicine
+from ..utils import invalidate_master_cache, normalize_composition
 import logging
 from datetime import datetime
 from sqlalchemy.exc import SQLAlchemyError
@@ -17,9 +18,11 @@ def create_medicine_master_record_db(db_medicine_master, db: Session):
     Creating medicine_master record
     """
     try:
+        db_medicine_master.composition_key = normalize_composition(db_medicine_master.composition)
         db.add(db_medicine_master)
         db.commit()
         db.refresh(db_medicine_master)
+        invalidate_master_cache(MedicineMasterModel)
         return db_medicine_master
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
@@ -87,10 +90,12 @@ def update_medicine_master_record_db(medicine_name: str, medicine_master: Update
         db_medicine_master.manufacturer_id = medicine_master.manufacturer_id
         db_medicine_master.category_id = medicine_master.category_id
         db_medicine_master.composition = medicine_master.composition
+        db_medicine_master.composition_key = normalize_composition(medicine_master.composition)
         db_medicine_master.updated_at = datetime.now()
         
         db.commit()
         db.refresh(db_medicine_master)
+        invalidate_master_cache(MedicineMasterModel)
         return db_medicine_master
     except Exception as e:
         db.rollback()
@@ -109,10 +114,25 @@ def activate_medicine_record_db(medicine_name, active_flag, db:Session):
         db_medicine_master.updated_at = datetime.now()
         db.commit()
         db.refresh(db_medicine_master)
+        invalidate_master_cache(MedicineMasterModel)
         return db_medicine_master
     except Exception as e:
         db.rollback()
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
-        
\ No newline at end of file
+def rebuild_composition_keys_db(db: Session):
+    """
+    Recompute the normalised composition of every medicine
+    """
+    try:
+        medicines = db.query(MedicineMasterModel).all()
+        for medicine in medicines:
+            medicine.composition_key = normalize_composition(medicine.composition)
+        db.commit()
+        invalidate_master_cache(MedicineMasterModel)
+        return len(medicines)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
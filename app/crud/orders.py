@@ -5,6 +5,8 @@ from pydantic import parse_obj_as
 from ..db.mongodb import get_database
 from ..models.store_mongodb_models import Order
 import logging
+from typing import Optional
+from ..utils import get_page_limit, cursor_query, parse_fields, select_fields, build_page, get_customers_by_ids
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -32,7 +34,7 @@ async def get_order_collection_db(store_id: int, db=Depends(get_database)):
             customer = await db.customers.find_one({"_id": ObjectId(customer_id)})
             if customer:
                 return {
-                    "order_id": str(order["_id"]),
+                    "order_id": order["_id"],
                     "store_id": order["store_id"],
                     "customer_name": customer["name"],
                     "customer_email": customer["email"],
@@ -50,61 +52,53 @@ async def get_order_collection_db(store_id: int, db=Depends(get_database)):
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
-async def get_order_collection_pending_db(store_id: int, db=Depends(get_database)):
+async def get_orders_by_status_db(store_id: int, order_status: str, db, limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None):
+    """ Get a page of the store orders in a status, with the customers fetched in one query. """
+    limit = get_page_limit(limit)
+    fields = parse_fields(fields)
+    projection = {"order_items": 0} if fields and "items" not in fields else None
+    query = cursor_query({"store_id": store_id, "order_status": order_status}, cursor)
+    page = await db.orders.find(query, projection).sort("_id", 1).limit(limit + 1).to_list(length=None)
+    next_id = page[limit - 1]["_id"] if len(page) > limit else None
+    page = page[:limit]
+    customers = await get_customers_by_ids({order["customer_id"] for order in page}, db)
+    orders = []
+    for order in page:
+        customer = customers.get(str(order["customer_id"]))
+        if customer:
+            orders.append(select_fields({
+                "order_id": order["_id"],
+                "store_id": order["store_id"],
+                "customer_name": customer["name"],
+                "customer_email": customer["email"],
+                "customer_mobile": customer["mobile"],
+                "customer_address": customer["address"],
+                "customer_doctor_name": customer.get("doctor_name", None),
+                "order_date": order["order_date"],
+                "order_status": order["order_status"],
+                "payment_method": order["payment_method"],
+                "total_amount": order["total_amount"],
+                "items": order.get("order_items"),
+            }, fields))
+    return orders, next_id
+
+async def get_order_collection_pending_db(store_id: int, db=Depends(get_database), limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None):
     """ Get pending orders from the database. """
     try:
-        orders_cursor = db.orders.find({"store_id": store_id, "order_status": "pending"})
-        orders = []
-        async for order in orders_cursor:
-            customer_id = str(order["customer_id"])
-            customer = await db.customers.find_one({"_id": ObjectId(customer_id)})
-            if customer:
-                orders.append({
-                    "order_id": str(order["_id"]),
-                    "store_id": order["store_id"],
-                    "customer_name": customer["name"],
-                    "customer_email": customer["email"],
-                    "customer_mobile": customer["mobile"],
-                    "customer_address": customer["address"],
-                    "customer_doctor_name": customer.get("doctor_name", None),
-                    "order_date": order["order_date"],
-                    "order_status": order["order_status"],
-                    "payment_method": order["payment_method"],
-                    "total_amount": order["total_amount"],
-                    "items": order["order_items"],
-                })
-        if orders:
-            return orders
+        orders, next_id = await get_orders_by_status_db(store_id, "pending", db, limit=limit, cursor=cursor, fields=fields)
+        if orders or cursor or next_id is not None:
+            return build_page(orders, next_id)
         raise HTTPException(status_code=404, detail="No pending orders found")
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
-async def get_order_collection_delivered_db(store_id: int, db=Depends(get_database)):
+async def get_order_collection_delivered_db(store_id: int, db=Depends(get_database), limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None):
     """ Get delivered orders from the database. """
     try:
-        orders_cursor = db.orders.find({"store_id": store_id, "order_status": "delivered"})
-        orders = []
-        async for order in orders_cursor:
-            customer_id = str(order["customer_id"])
-            customer = await db.customers.find_one({"_id": ObjectId(customer_id)})
-            if customer:
-                orders.append({
-                    "order_id": str(order["_id"]),
-                    "store_id": order["store_id"],
-                    "customer_name": customer["name"],
-                    "customer_email": customer["email"],
-                    "customer_mobile": customer["mobile"],
-                    "customer_address": customer["address"],
-                    "customer_doctor_name": customer.get("doctor_name", None),
-                    "order_date": order["order_date"],
-                    "order_status": order["order_status"],
-                    "payment_method": order["payment_method"],
-                    "total_amount": order["total_amount"],
-                    "items": order["order_items"],
-                })
-        if orders:
-            return orders
+        orders, next_id = await get_orders_by_status_db(store_id, "delivered", db, limit=limit, cursor=cursor, fields=fields)
+        if orders or cursor or next_id is not None:
+            return build_page(orders, next_id)
         raise HTTPException(status_code=404, detail="No delivered orders found")
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
@@ -30,8 +30,6 @@ async def get_all_collection_db(store_id: int, medicine_id: int, db):
     """
     try:
         result = await db.pricing.find({"store_id": store_id, "medicine_id": medicine_id, "active_flag": 1}).to_list(length=None)
-        for item in result:
-            item["_id"] = str(item["_id"])
         return result
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
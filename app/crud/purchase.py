@@ -1,60 +1,61 @@
 from fastapi import Depends, HTTPException
 from bson import ObjectId
 from typing import List
-from sqlalchemy.orm import Session
-from ..db.mongodb import get_database
-from ..db.mysql_session import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db.mongodb import get_database, run_in_transaction
+from pymongo import UpdateOne
+from ..db.mysql_session import get_async_db
 from ..models.store_mysql_models import MedicineMaster, Distributor, Manufacturer, StoreDetails
 from ..models.store_mongodb_models import Purchase
 import logging
 from datetime import datetime
-from ..utils import get_name_by_id, validate_by_id
+from typing import Optional
+from ..db.mysql import AsyncSessionLocal
+from ..utils import get_names_by_ids_async, validate_by_id_async, get_page_limit, cursor_query, parse_fields, select_fields, build_page, batched, EXPORT_BATCH_SIZE
+from .inventory import refresh_inventory_db
+from .rollups import purchase_rollup_updates
+from .reorder import refresh_reorder_points_db
+from .batches import BATCH_COLLECTION, batch_documents
 
 # Configure logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-async def create_purchase_collection_db(purchase, db, mysql_db: Session):
+async def create_purchase_collection_db(purchase, db, mysql_db: AsyncSession):
     """
     Creating the purchase collection in the database.
     """
     try:
         # Distributor validation
-        distributor_validation = validate_by_id(id=purchase["distributor_id"], model=Distributor, field="distributor_id", db=mysql_db)
+        distributor_validation = await validate_by_id_async(id=purchase["distributor_id"], model=Distributor, field="distributor_id", db=mysql_db)
         if distributor_validation == "unique":
             raise HTTPException(status_code=404, detail="Distributor not Found.")
-        
+
+        # medicine and manufacturer validation, one query per table for all the lines
+        medicine_ids = {item["medicine_id"] for item in purchase["purchase_items"]}
+        manufacturer_ids = {item["manufacture_id"] for item in purchase["purchase_items"]}
+        medicines = await get_names_by_ids_async(ids=medicine_ids, model=MedicineMaster, field="medicine_id", name_field="medicine_name", db=mysql_db)
+        if medicine_ids - medicines.keys():
+            raise HTTPException(status_code=404, detail="Medicine not found")
+        manufacturers = await get_names_by_ids_async(ids=manufacturer_ids, model=Manufacturer, field="manufacturer_id", name_field="manufacturer_name", db=mysql_db)
+        if manufacturer_ids - manufacturers.keys():
+            raise HTTPException(status_code=404, detail="Manufacturer not found")
+
         purchase_items = []
+        stocks = {}
         for item in purchase["purchase_items"]:
-            # medicine validation
             medicine_id = item["medicine_id"]
-            if validate_by_id(id=medicine_id, model=MedicineMaster, field="medicine_id", db=mysql_db) == "unique":
-                raise HTTPException(status_code=404, detail="Medicine not found")
-            # manufacturer validation
-            manufacturer_id = item["manufacture_id"]
-            if validate_by_id(id=manufacturer_id, model=MedicineMaster, field="manufacturer_id", db=mysql_db) == "unique":
-                raise HTTPException(status_code=404, detail="Manufacturer not found")
-            
-            # stock
-            stock = {
+            # stock, grouped by medicine so each stock document gets a single upsert
+            stock = stocks.setdefault(medicine_id, {"batch_details": [], "available_stock": 0})
+            stock["batch_details"].append({
                 "expiry_date": item["expiry_date"],
                 "units_in_pack": item["packagetype_quantity"],
                 "batch": item["purchase_quantity"],
                 "batch_number": item["batch_number"],
                 "is_active": 1
-            }
-            # Update stock in the database
-            await db.stocks.update_one(
-                {"store_id": purchase["store_id"], "medicine_id": medicine_id},
-                {
-                    "$push": {"batch_details": stock},
-                    "$inc": {"available_stock": item["purchase_quantity"]},
-                    "$set": {"updated_at": datetime.now()}
-                },
-                upsert=True
-            )
-            logger.info("Updated in stocks")
-            
+            })
+            stock["available_stock"] += item["purchase_quantity"]
+
             purchase_items.append({
                 "medicine_id": medicine_id,
                 "batch_number": item["batch_number"],
@@ -69,7 +70,23 @@ async def create_purchase_collection_db(purchase, db, mysql_db: Session):
                 "purchase_amount": item["purchase_amount"],
                 "purchase_quantity": item["purchase_quantity"]
             })
-        
+
+        stock_updates = []
+        batches = []
+        for medicine_id, stock in stocks.items():
+            update = {
+                "$inc": {"available_stock": stock["available_stock"]},
+                "$set": {"updated_at": datetime.now()},
+                "$setOnInsert": {"active_flag": 1, "created_at": datetime.now()}
+            }
+            # the batches go to stock_batches instead of growing the stock document
+            if BATCH_COLLECTION:
+                batches += batch_documents(purchase["store_id"], medicine_id, stock["batch_details"], datetime.now())
+                update["$setOnInsert"]["batch_details"] = []
+            else:
+                update["$push"] = {"batch_details": {"$each": stock["batch_details"]}}
+            stock_updates.append(UpdateOne({"store_id": purchase["store_id"], "medicine_id": medicine_id}, update, upsert=True))
+
         result = {
             "store_id": purchase["store_id"],
             "purchase_date": purchase["purchase_date"],
@@ -83,7 +100,22 @@ async def create_purchase_collection_db(purchase, db, mysql_db: Session):
             "active_flag": 1,
             "purchase_items": purchase_items
         }
-        results = await db.purchases.insert_one(result)
+
+        async def write_purchase(session):
+            inserted = await db.purchases.insert_one(result, session=session)
+            if stock_updates:
+                await db.stocks.bulk_write(stock_updates, ordered=False, session=session)
+            if batches:
+                await db.stock_batches.insert_many(batches, ordered=False, session=session)
+            rollup = purchase_rollup_updates(result)
+            if rollup:
+                await db.daily_purchase_rollup.bulk_write(rollup, ordered=False, session=session)
+            return inserted
+
+        results = await run_in_transaction(db, write_purchase)
+        logger.info(f"Updated {len(stock_updates)} stocks")
+        await refresh_inventory_db(purchase["store_id"], list(stocks), db, mysql_db)
+        await refresh_reorder_points_db(purchase["store_id"], db, list(stocks))
         result["_id"] = str(results.inserted_id)
         logger.info(f"Purchase created with ID: {result['_id']}")
         return result
@@ -91,218 +123,193 @@ async def create_purchase_collection_db(purchase, db, mysql_db: Session):
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
     
-async def get_all_purchases_db(store_id: int, db, mysql_db: Session):
+async def build_purchase_list(purchases, mysql_db: AsyncSession):
     """
-    Get all purchases from the database
+    Build the purchase listing, resolving the names with one query per table
     """
-    try:
-        result = []
-        purchases_cursor = db.purchases.find({"store_id": store_id, "active_flag": 1})
-        async for purchase in purchases_cursor:
-            purchase_id = str(purchase["_id"])
-            purchase_date = str(purchase["purchase_date"])
+    distributor_ids, store_ids, medicine_ids, manufacturer_ids = set(), set(), set(), set()
+    for purchase in purchases:
+        distributor_ids.add(purchase["distributor_id"])
+        store_ids.add(purchase["store_id"])
+        for item in purchase.get("purchase_items", []):
+            medicine_ids.add(item["medicine_id"])
+            manufacturer_ids.add(item["manufacture_id"])
 
-            distributor_name = get_name_by_id(id=purchase["distributor_id"], model=Distributor, field="distributor_id", name_field="distributor_name", db=mysql_db)
-            if distributor_name == "unique":
-                raise HTTPException(status_code=400, detail="Distributor not Found")
+    distributor_names = await get_names_by_ids_async(ids=distributor_ids, model=Distributor, field="distributor_id", name_field="distributor_name", db=mysql_db)
+    store_names = await get_names_by_ids_async(ids=store_ids, model=StoreDetails, field="store_id", name_field="store_name", db=mysql_db)
+    medicine_names = await get_names_by_ids_async(ids=medicine_ids, model=MedicineMaster, field="medicine_id", name_field="medicine_name", db=mysql_db)
+    manufacturer_names = await get_names_by_ids_async(ids=manufacturer_ids, model=Manufacturer, field="manufacturer_id", name_field="manufacturer_name", db=mysql_db)
 
-            store_name = get_name_by_id(id=purchase["store_id"], model=StoreDetails, field="store_id", name_field="store_name", db=mysql_db)
-            if store_name == "unique":
-                raise HTTPException(status_code=400, detail="Store not Found")
-            total_amount = str(purchase["purchased_amount"])
+    result = []
+    for purchase in purchases:
+        distributor_name = distributor_names.get(purchase["distributor_id"])
+        if distributor_name is None:
+            raise HTTPException(status_code=400, detail="Distributor not Found")
 
-            purchase_items = []
-            for item in purchase["purchase_items"]:
-                medicine_name = get_name_by_id(id=item["medicine_id"], model=MedicineMaster, field="medicine_id", name_field="medicine_name", db=mysql_db)
-                if medicine_name == "unique":
-                    raise HTTPException(status_code=400, detail="Medicine not Found")
+        store_name = store_names.get(purchase["store_id"])
+        if store_name is None:
+            raise HTTPException(status_code=400, detail="Store not Found")
 
-                manufacturer_name = get_name_by_id(id=item["manufacture_id"], model=Manufacturer, field="manufacturer_id", name_field="manufacturer_name", db=mysql_db)
-                if manufacturer_name == "unique":
-                    raise HTTPException(status_code=400, detail="Manufacturer not Found")
+        purchase_items = []
+        for item in purchase.get("purchase_items", []):
+            medicine_name = medicine_names.get(item["medicine_id"])
+            if medicine_name is None:
+                raise HTTPException(status_code=400, detail="Medicine not Found")
 
-                purchase_items.append({
-                    "medicine_id": item["medicine_id"],
-                    "medicine_name": medicine_name,
-                    "batch_number": item["batch_number"],
-                    "quantity": item["purchase_quantity"],
-                    "price": item["purchase_mrp"],
-                    "expiry_date": item["expiry_date"],
-                    "manufacturer_name": manufacturer_name,
-                    "medicine_form": item["medicine_form"],
-                    "units_in_pack": item["units_per_package_type"],
-                    "unit_quantity": item["packagetype_quantity"],
-                    "package": item["package_type"],
-                    "package_count": item["packagetype_quantity"],
-                    "medicine_quantity": item["purchase_quantity"]
-                })
+            manufacturer_name = manufacturer_names.get(item["manufacture_id"])
+            if manufacturer_name is None:
+                raise HTTPException(status_code=400, detail="Manufacturer not Found")
 
-            result.append({
-                "purchase_id": purchase_id,
-                "store_id": purchase["store_id"],
-                "store_name": store_name,
-                "purchase_date": purchase_date,
-                "distributor_id": purchase["distributor_id"],
-                "distributor_name": distributor_name,
-                "purchased_amount": total_amount,
-                "invoice_number": purchase["invoice_number"],
-                "purchase_items": purchase_items
+            purchase_items.append({
+                "medicine_id": item["medicine_id"],
+                "medicine_name": medicine_name,
+                "batch_number": item["batch_number"],
+                "quantity": item["purchase_quantity"],
+                "price": item["purchase_mrp"],
+                "expiry_date": item["expiry_date"],
+                "manufacturer_name": manufacturer_name,
+                "medicine_form": item["medicine_form"],
+                "units_in_pack": item["units_per_package_type"],
+                "unit_quantity": item["packagetype_quantity"],
+                "package": item["package_type"],
+                "package_count": item["packagetype_quantity"],
+                "medicine_quantity": item["purchase_quantity"]
             })
-        return result
+
+        result.append({
+            "purchase_id": purchase["_id"],
+            "store_id": purchase["store_id"],
+            "store_name": store_name,
+            "purchase_date": purchase["purchase_date"],
+            "distributor_id": purchase["distributor_id"],
+            "distributor_name": distributor_name,
+            "purchased_amount": str(purchase["purchased_amount"]),
+            "invoice_number": purchase["invoice_number"],
+            "purchase_items": purchase_items
+        })
+    return result
+
+async def find_purchases_page(query: dict, db, mysql_db: AsyncSession, limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None):
+    """
+    Get a page of purchases ordered by _id, with the names resolved
+    """
+    limit = get_page_limit(limit)
+    fields = parse_fields(fields)
+    # the line items are the bulk of a purchase, skip them unless they are asked for
+    projection = {"purchase_items": 0} if fields and "purchase_items" not in fields else None
+    purchases = await db.purchases.find(cursor_query(query, cursor), projection).sort("_id", 1).limit(limit + 1).to_list(length=None)
+    next_id = purchases[limit - 1]["_id"] if len(purchases) > limit else None
+    items = [select_fields(item, fields) for item in await build_purchase_list(purchases[:limit], mysql_db)]
+    return build_page(items, next_id)
+
+async def get_all_purchases_db(store_id: int, db, mysql_db: AsyncSession, limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None):
+    """
+    Get all purchases from the database
+    """
+    try:
+        return await find_purchases_page({"store_id": store_id, "active_flag": 1}, db, mysql_db, limit=limit, cursor=cursor, fields=fields)
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
-async def get_purchases_by_id_db(id: str, db, mysql_db: Session):
+async def get_purchases_by_id_db(id: str, db, mysql_db: AsyncSession):
     """
     Get purchase by ID from the database
     """
     try:
-        result = []
         purchase = await db.purchases.find_one({"_id": ObjectId(id)})
         if purchase:
-            purchase_id = str(purchase["_id"])
-            purchase_date = str(purchase["purchase_date"])
-
-            distributor_name = get_name_by_id(id=purchase["distributor_id"], model=Distributor, field="distributor_id", name_field="distributor_name", db=mysql_db)
-            if distributor_name == "unique":
-                raise HTTPException(status_code=400, detail="Distributor not Found")
-
-            store_name = get_name_by_id(id=purchase["store_id"], model=StoreDetails, field="store_id", name_field="store_name", db=mysql_db)
-            if store_name == "unique":
-                raise HTTPException(status_code=400, detail="Store not Found")
-            
-            total_amount = str(purchase["purchased_amount"])
-
-            purchase_items = []
-            for item in purchase["purchase_items"]:
-                medicine_name = get_name_by_id(id=item["medicine_id"], model=MedicineMaster, field="medicine_id", name_field="medicine_name", db=mysql_db)
-                if medicine_name == "unique":
-                    raise HTTPException(status_code=400, detail="Medicine not Found")
-
-                manufacturer_name = get_name_by_id(id=item["manufacture_id"], model=Manufacturer, field="manufacturer_id", name_field="manufacturer_name", db=mysql_db)
-                if manufacturer_name == "unique":
-                    raise HTTPException(status_code=400, detail="Manufacturer not Found")
-
-                purchase_items.append({
-                    "medicine_id": item["medicine_id"],
-                    "medicine_name": medicine_name,
-                    "batch_number": item["batch_number"],
-                    "quantity": item["purchase_quantity"],
-                    "price": item["purchase_mrp"],
-                    "expiry_date": item["expiry_date"],
-                    "manufacturer_name": manufacturer_name,
-                    "medicine_form": item["medicine_form"],
-                    "units_in_pack": item["units_per_package_type"],
-                    "unit_quantity": item["packagetype_quantity"],
-                    "package": item["package_type"],
-                    "package_count": item["packagetype_quantity"],
-                    "medicine_quantity": item["purchase_quantity"]
-                })
-
-            result.append({
-                "purchase_id": purchase_id,
-                "store_id": purchase["store_id"],
-                "store_name": store_name,
-                "purchase_date": purchase_date,
-                "distributor_id": purchase["distributor_id"],
-                "distributor_name": distributor_name,
-                "purchased_amount": total_amount,
-                "invoice_number": purchase["invoice_number"],
-                "purchase_items": purchase_items
-            })
-        return result
+            return await build_purchase_list([purchase], mysql_db)
+        return []
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
-async def get_purchases_by_date_db(store_id: int, db, mysql_db: Session, start_date: str = None, end_date: str = None):
+async def get_purchases_by_date_db(store_id: int, db, mysql_db: AsyncSession, start_date: str = None, end_date: str = None, limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None):
     """
     Get all purchases from the database store start_date and end_date
     """
     try:
-        result = []
+        query = {"store_id": store_id, "active_flag": 1}
         if start_date and end_date:
             # Parse the start and end dates
             start_date = datetime.strptime(start_date, '%Y-%m-%d')
             end_date = datetime.strptime(end_date, '%Y-%m-%d')
             # Fetch purchases from MongoDB within the date range
-            purchases_cursor = db.purchases.find({
-                "store_id": store_id,
-                "active_flag": 1,
-                "purchase_date": {"$gte": start_date, "$lte": end_date}
-            })
-        else:
-            # Fetch all purchases from MongoDB
-            purchases_cursor = db.purchases.find({"store_id": store_id, "active_flag": 1})
-
-        purchases = await purchases_cursor.to_list(length=None)
-        for purchase in purchases:
-            purchase_id = str(purchase["_id"])
-            purchase_date = str(purchase["purchase_date"])
-
-            distributor_name = get_name_by_id(id=purchase["distributor_id"], model=Distributor, field="distributor_id", name_field="distributor_name", db=mysql_db)
-            if distributor_name == "unique":
-                raise HTTPException(status_code=400, detail="Distributor not Found")
-
-            store_name = get_name_by_id(id=purchase["store_id"], model=StoreDetails, field="store_id", name_field="store_name", db=mysql_db) 
-            if store_name == "unique":
-                raise HTTPException(status_code=400, detail="Store not Found")
-            
-            total_amount = str(purchase["purchased_amount"])
-
-            purchase_items = []
-            for item in purchase["purchase_items"]:
-                medicine_name = get_name_by_id(id=item["medicine_id"], model=MedicineMaster, field="medicine_id", name_field="medicine_name", db=mysql_db)
-                if medicine_name == "unique":
-                    raise HTTPException(status_code=400, detail="Medicine not Found")
-
-                manufacturer_name = get_name_by_id(id=item["manufacture_id"], model=Manufacturer, field="manufacturer_id", name_field="manufacturer_name", db=mysql_db)
-                if manufacturer_name == "unique":
-                    raise HTTPException(status_code=400, detail="Manufacturer not Found")
-
-                purchase_items.append({
-                    "medicine_id": item["medicine_id"],
-                    "medicine_name": medicine_name,
-                    "batch_number": item["batch_number"],
-                    "quantity": item["purchase_quantity"],
-                    "price": item["purchase_mrp"],
-                    "expiry_date": item["expiry_date"],
-                    "manufacturer_name": manufacturer_name,
-                    "medicine_form": item["medicine_form"],
-                    "units_in_pack": item["units_per_package_type"],
-                    "unit_quantity": item["packagetype_quantity"],
-                    "package": item["package_type"],
-                    "package_count": item["packagetype_quantity"],
-                    "medicine_quantity": item["purchase_quantity"]
-                })
-
-            result.append({
-                "purchase_id": purchase_id,
-                "store_id": purchase["store_id"],
-                "store_name": store_name,
-                "purchase_date": purchase_date,
-                "distributor_id": purchase["distributor_id"],
-                "distributor_name": distributor_name,
-                "purchased_amount": total_amount,
-                "invoice_number": purchase["invoice_number"],
-                "purchase_items": purchase_items
-            })
-        return result
+            query["purchase_date"] = {"$gte": start_date, "$lte": end_date}
+        return await find_purchases_page(query, db, mysql_db, limit=limit, cursor=cursor, fields=fields)
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
+# one row per purchase line
+PURCHASE_EXPORT_COLUMNS = [
+    "purchase_id", "invoice_number", "purchase_date", "store_id", "store_name", "distributor_id", "distributor_name",
+    "purchased_amount", "medicine_id", "medicine_name", "manufacturer_name", "batch_number", "expiry_date",
+    "purchase_quantity", "purchase_mrp", "purchase_discount", "purchase_amount"
+]
+
+async def stream_purchase_rows_db(store_id: int, db, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
+    """
+    Yield the purchase lines of the store in purchase_date order, a cursor batch at a time.
+    Uses its own MySQL session, the request one is closed before the body is streamed.
+    """
+    query = {"store_id": store_id, "active_flag": 1}
+    if start_date or end_date:
+        query["purchase_date"] = {}
+        if start_date:
+            query["purchase_date"]["$gte"] = start_date
+        if end_date:
+            query["purchase_date"]["$lt"] = end_date
+    cursor = db.purchases.find(query).sort([("purchase_date", 1), ("_id", 1)]).batch_size(EXPORT_BATCH_SIZE)
+    async with AsyncSessionLocal() as mysql_db:
+        async for purchases in batched(cursor):
+            medicine_ids = {item["medicine_id"] for purchase in purchases for item in purchase.get("purchase_items", [])}
+            manufacturer_ids = {item["manufacture_id"] for purchase in purchases for item in purchase.get("purchase_items", [])}
+            store_names = await get_names_by_ids_async(ids={store_id}, model=StoreDetails, field="store_id", name_field="store_name", db=mysql_db)
+            distributor_names = await get_names_by_ids_async(ids={purchase["distributor_id"] for purchase in purchases}, model=Distributor, field="distributor_id", name_field="distributor_name", db=mysql_db)
+            medicine_names = await get_names_by_ids_async(ids=medicine_ids, model=MedicineMaster, field="medicine_id", name_field="medicine_name", db=mysql_db)
+            manufacturer_names = await get_names_by_ids_async(ids=manufacturer_ids, model=Manufacturer, field="manufacturer_id", name_field="manufacturer_name", db=mysql_db)
+            for purchase in purchases:
+                for item in purchase.get("purchase_items", []):
+                    yield {
+                        "purchase_id": str(purchase["_id"]),
+                        "invoice_number": purchase["invoice_number"],
+                        "purchase_date": purchase["purchase_date"],
+                        "store_id": store_id,
+                        "store_name": store_names.get(store_id),
+                        "distributor_id": purchase["distributor_id"],
+                        "distributor_name": distributor_names.get(purchase["distributor_id"]),
+                        "purchased_amount": purchase["purchased_amount"],
+                        "medicine_id": item["medicine_id"],
+                        "medicine_name": medicine_names.get(item["medicine_id"]),
+                        "manufacturer_name": manufacturer_names.get(item["manufacture_id"]),
+                        "batch_number": item["batch_number"],
+                        "expiry_date": item["expiry_date"],
+                        "purchase_quantity": item["purchase_quantity"],
+                        "purchase_mrp": item["purchase_mrp"],
+                        "purchase_discount": item["purchase_discount"],
+                        "purchase_amount": item["purchase_amount"]
+                    }
+
 async def delete_purchase_collection_db(purchase_id: str, db=Depends(get_database)):
     
     """
     Deleting the purchase collection from the database.
     """
     try:
-        delete_result = await db.purchases.update_one(
-            {"_id": ObjectId(str(purchase_id))}, 
-            {"$set": {"active_flag":0}})
-        if delete_result.modified_count == 1:
+        async def soft_delete(session):
+            purchase = await db.purchases.find_one_and_update(
+                {"_id": ObjectId(str(purchase_id)), "active_flag": {"$ne": 0}},
+                {"$set": {"active_flag":0}},
+                session=session)
+            if purchase:
+                rollup = purchase_rollup_updates(purchase, sign=-1)
+                if rollup:
+                    await db.daily_purchase_rollup.bulk_write(rollup, ordered=False, session=session)
+            return purchase
+
+        if await run_in_transaction(db, soft_delete):
             return {"message": "Purchase deleted successfully", "purchase_id": purchase_id}
         raise HTTPException(status_code=404, detail="Purchase not found")
     except Exception as e:
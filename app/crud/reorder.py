@@ -0,0 +1,205 @@
+from fastapi import HTTPException
+from pymongo import UpdateOne
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import logging
+import os
+import sys
+import numpy as np
+from ..db.mongodb import get_database
+from ..db.indexes import INDEXES
+from ..models.store_mysql_models import MedicineMaster
+from ..utils import get_names_by_ids_async, get_page_limit, cursor_query, build_page
+from .rollups import day_of
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# days of sales history the consumption is averaged over
+REORDER_WINDOW_DAYS = int(os.getenv("REORDER_WINDOW_DAYS", "90"))
+# days between placing a purchase and the stock arriving
+REORDER_LEAD_TIME_DAYS = float(os.getenv("REORDER_LEAD_TIME_DAYS", "7"))
+# safety stock in standard deviations of the daily demand, 1.65 covers about 95% of the lead times
+REORDER_SERVICE_Z = float(os.getenv("REORDER_SERVICE_Z", "1.65"))
+# days between purchases of a medicine that was not purchased in the window
+REORDER_REVIEW_DAYS = float(os.getenv("REORDER_REVIEW_DAYS", "30"))
+
+MS_PER_DAY = 86400000
+
+def consumption_pipeline(store_id: int, medicine_ids: list, start: datetime, end: datetime):
+    """
+    Columnar extract of the daily sold quantities, one document per medicine
+    holding the day offsets in the window and the quantities of those days
+    """
+    return [
+        {"$match": {"store_id": store_id, "medicine_id": {"$in": medicine_ids}, "day": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": "$medicine_id",
+            "days": {"$push": {"$toInt": {"$divide": [{"$subtract": ["$day", start]}, MS_PER_DAY]}}},
+            "quantities": {"$push": "$quantity"}
+        }}
+    ]
+
+def purchase_days_pipeline(store_id: int, medicine_ids: list, start: datetime, end: datetime):
+    """
+    Number of days each medicine was purchased on in the window
+    """
+    return [
+        {"$match": {"store_id": store_id, "medicine_id": {"$in": medicine_ids}, "day": {"$gte": start, "$lt": end}, "quantity": {"$gt": 0}}},
+        {"$group": {"_id": "$medicine_id", "purchase_days": {"$sum": 1}}}
+    ]
+
+def consumption_matrix(columns: list, index: dict, window: int):
+    """
+    (medicines x days) matrix of the sold quantities built from the columnar extract
+    """
+    matrix = np.zeros((len(index), window))
+    if columns:
+        rows = np.concatenate([np.full(len(column["days"]), index[column["_id"]], dtype=np.intp) for column in columns])
+        days = np.concatenate([np.asarray(column["days"], dtype=np.intp) for column in columns])
+        quantities = np.concatenate([np.asarray(column["quantities"], dtype=float) for column in columns])
+        np.add.at(matrix, (rows, days), quantities)
+    # guards a rollup row left out of step with the sales until it is rebuilt
+    return np.clip(matrix, 0, None)
+
+def compute_reorder_points(matrix, available, purchase_days, window: int, lead_time: float = REORDER_LEAD_TIME_DAYS, z: float = REORDER_SERVICE_Z):
+    """
+    Average daily consumption, lead-time demand, safety stock and reorder point of every
+    medicine at once. The order quantity covers the lead time and the purchase cycle
+    seen in the purchase history.
+    """
+    average = matrix.mean(axis=1)
+    deviation = matrix.std(axis=1, ddof=1) if window > 1 else np.zeros(len(matrix))
+    lead_time_demand = average * lead_time
+    safety_stock = z * deviation * np.sqrt(lead_time)
+    reorder_point = np.ceil(lead_time_demand + safety_stock)
+    cycle = np.where(purchase_days > 0, window / np.maximum(purchase_days, 1), REORDER_REVIEW_DAYS)
+    reorder_quantity = np.maximum(np.ceil(average * (lead_time + cycle) + safety_stock - available), 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_cover = np.where(average > 0, available / average, np.inf)
+    return {
+        "average_daily_consumption": np.round(average, 3),
+        "demand_deviation": np.round(deviation, 3),
+        "lead_time_demand": np.round(lead_time_demand, 2),
+        "safety_stock": np.round(safety_stock, 2),
+        "reorder_point": reorder_point,
+        "reorder_quantity": reorder_quantity,
+        "days_of_cover": np.round(days_of_cover, 1),
+        "needs_reorder": (average > 0) & (available <= reorder_point)
+    }
+
+def reorder_updates(store_id: int, medicine_ids: list, available, results: dict, now: datetime):
+    """
+    One upsert per medicine into reorder_points, numpy scalars converted for BSON
+    """
+    updates = []
+    for position, medicine_id in enumerate(medicine_ids):
+        days_of_cover = float(results["days_of_cover"][position])
+        updates.append(UpdateOne(
+            {"store_id": store_id, "medicine_id": medicine_id},
+            {"$set": {
+                "available_stock": int(available[position]),
+                "average_daily_consumption": float(results["average_daily_consumption"][position]),
+                "demand_deviation": float(results["demand_deviation"][position]),
+                "lead_time_days": REORDER_LEAD_TIME_DAYS,
+                "lead_time_demand": float(results["lead_time_demand"][position]),
+                "safety_stock": float(results["safety_stock"][position]),
+                "reorder_point": int(results["reorder_point"][position]),
+                "reorder_quantity": int(results["reorder_quantity"][position]),
+                "days_of_cover": days_of_cover if np.isfinite(days_of_cover) else None,
+                "needs_reorder": bool(results["needs_reorder"][position]),
+                "computed_at": now
+            }},
+            upsert=True
+        ))
+    return updates
+
+async def refresh_reorder_points_db(store_id: int, db, medicine_ids=None):
+    """
+    Recompute the reorder points of the medicines, of every stocked medicine of the store by default.
+    Failures are logged and left for the rebuild, the source write has already happened.
+    """
+    try:
+        query = {"store_id": store_id, "active_flag": 1}
+        if medicine_ids is not None:
+            medicine_ids = list(set(medicine_ids))
+            if not medicine_ids:
+                return 0
+            query["medicine_id"] = {"$in": medicine_ids}
+        stocks = await db.stocks.find(query, {"medicine_id": 1, "available_stock": 1}).to_list(length=None)
+        available_by_medicine = {}
+        for stock in stocks:
+            available_by_medicine.setdefault(stock["medicine_id"], stock.get("available_stock") or 0)
+        if not available_by_medicine:
+            return 0
+        if query.get("medicine_id") is None:
+            # drop the rows of medicines that are no longer stocked
+            await db.reorder_points.delete_many({"store_id": store_id, "medicine_id": {"$nin": list(available_by_medicine)}})
+        medicine_ids = list(available_by_medicine)
+        index = {medicine_id: position for position, medicine_id in enumerate(medicine_ids)}
+
+        now = datetime.now()
+        end = day_of(now) + timedelta(days=1)
+        start = end - timedelta(days=REORDER_WINDOW_DAYS)
+        columns, purchases = await asyncio.gather(
+            db.daily_sales_rollup.aggregate(consumption_pipeline(store_id, medicine_ids, start, end)).to_list(length=None),
+            db.daily_purchase_rollup.aggregate(purchase_days_pipeline(store_id, medicine_ids, start, end)).to_list(length=None)
+        )
+        available = np.array([available_by_medicine[medicine_id] for medicine_id in medicine_ids], dtype=float)
+        purchase_days = np.zeros(len(medicine_ids))
+        for row in purchases:
+            purchase_days[index[row["_id"]]] = row["purchase_days"]
+
+        matrix = consumption_matrix(columns, index, REORDER_WINDOW_DAYS)
+        results = compute_reorder_points(matrix, available, purchase_days, REORDER_WINDOW_DAYS)
+        await db.reorder_points.bulk_write(reorder_updates(store_id, medicine_ids, available, results, now), ordered=False)
+        return len(medicine_ids)
+    except Exception as e:
+        logger.error(f"Error refreshing the reorder points of store {store_id}: {str(e)}")
+        return 0
+
+async def get_reorder_points_db(store_id: int, db, mysql_db: AsyncSession, below_only: bool = True, limit: Optional[int] = None, cursor: Optional[str] = None):
+    """
+    Page of the stored reorder points of the store, by default only the medicines to reorder
+    """
+    try:
+        limit = get_page_limit(limit)
+        query = {"store_id": store_id}
+        if below_only:
+            query["needs_reorder"] = True
+        rows = await db.reorder_points.find(cursor_query(query, cursor), {"store_id": 0}).sort("_id", 1).limit(limit + 1).to_list(length=None)
+        next_id = rows[limit - 1]["_id"] if len(rows) > limit else None
+        rows = rows[:limit]
+        names = await get_names_by_ids_async(ids={row["medicine_id"] for row in rows}, model=MedicineMaster, field="medicine_id", name_field="medicine_name", db=mysql_db)
+        items = []
+        for row in rows:
+            row.pop("_id")
+            items.append({"medicine_id": row["medicine_id"], "medicine_name": names.get(row["medicine_id"]), **row})
+        return build_page(items, next_id)
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+async def rebuild_reorder_points_db(db, store_id: Optional[int] = None):
+    """
+    Recompute the reorder points of every stocked medicine, for one store or all of them
+    """
+    await db.reorder_points.create_indexes(INDEXES["reorder_points"])
+    store_ids = [store_id] if store_id is not None else await db.stocks.distinct("store_id")
+    refreshed = 0
+    for store in store_ids:
+        refreshed += await refresh_reorder_points_db(store, db)
+        logger.info(f"Reorder points rebuilt for store {store}")
+    return refreshed
+
+async def main(argv):
+    store_id = int(argv[0]) if argv else None
+    refreshed = await rebuild_reorder_points_db(get_database(), store_id)
+    logger.info(f"Reorder points rebuilt, {refreshed} medicines computed")
+
+if __name__ == "__main__":
+    # python -m istore.app.crud.reorder [store_id]
+    asyncio.run(main(sys.argv[1:]))
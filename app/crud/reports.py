@@ -0,0 +1,159 @@
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Optional
+import asyncio
+import logging
+from ..models.store_mongodb_eunums import OrderStatus
+from ..models.store_mysql_models import MedicineMaster, Distributor
+from ..utils import get_names_by_ids_async
+from .rollups import SALE_DAY
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# $dateToString format of each reporting period, weeks are ISO weeks
+PERIOD_FORMATS = {"day": "%Y-%m-%d", "week": "%G-W%V", "month": "%Y-%m"}
+
+def period_key(date_expression, period: str):
+    """
+    Group key of the date expression for the period
+    """
+    return {"$dateToString": {"format": PERIOD_FORMATS[period], "date": date_expression}}
+
+def date_range_match(field: str, start_date: Optional[datetime], end_date: Optional[datetime], as_string: bool = False):
+    """
+    Range condition on a date field, sale_date is stored as its string form
+    """
+    condition = {}
+    if start_date:
+        condition["$gte"] = start_date.strftime('%Y-%m-%d') if as_string else start_date
+    if end_date:
+        condition["$lt"] = end_date.strftime('%Y-%m-%d') if as_string else end_date
+    return {field: condition} if condition else {}
+
+def top_medicines_stages(sort_field: str, top: int):
+    """
+    Daily rollup rows summed per medicine, the top ones by quantity or revenue
+    """
+    return [
+        {"$group": {"_id": "$medicine_id", "quantity": {"$sum": "$quantity"}, "revenue": {"$sum": "$revenue"}}},
+        {"$sort": {sort_field: -1, "_id": 1}},
+        {"$limit": top}
+    ]
+
+def sales_totals_pipeline(store_id: int, start_date, end_date, period: str):
+    """
+    Sale count and revenue per period
+    """
+    return [
+        {"$match": {"store_id": store_id, "active_flag": 1, **date_range_match("sale_date", start_date, end_date, as_string=True)}},
+        {"$group": {"_id": period_key(SALE_DAY, period), "sales": {"$sum": 1}, "revenue": {"$sum": "$total_amount"}}},
+        {"$sort": {"_id": 1}}
+    ]
+
+def top_medicines_pipeline(store_id: int, start_date, end_date, top: int):
+    """
+    Top medicines by quantity and by revenue from daily_sales_rollup in one $facet
+    """
+    return [
+        {"$match": {"store_id": store_id, **date_range_match("day", start_date, end_date)}},
+        {"$facet": {
+            "top_by_quantity": top_medicines_stages("quantity", top),
+            "top_by_revenue": top_medicines_stages("revenue", top)
+        }}
+    ]
+
+def purchase_report_pipeline(store_id: int, start_date, end_date, period: str, top: int):
+    """
+    Period totals and the distributor-wise spend in one $facet
+    """
+    return [
+        {"$match": {"store_id": store_id, "active_flag": 1, **date_range_match("purchase_date", start_date, end_date)}},
+        {"$facet": {
+            "totals": [
+                {"$group": {"_id": period_key("$purchase_date", period), "purchases": {"$sum": 1}, "spend": {"$sum": "$purchased_amount"}}},
+                {"$sort": {"_id": 1}}
+            ],
+            "distributors": [
+                {"$group": {"_id": "$distributor_id", "purchases": {"$sum": 1}, "spend": {"$sum": "$purchased_amount"}}},
+                {"$sort": {"spend": -1, "_id": 1}},
+                {"$limit": top}
+            ]
+        }}
+    ]
+
+def top_medicine_rows(rows: list, names: dict):
+    """
+    Top medicine rows with the resolved names
+    """
+    return [
+        {"medicine_id": row["_id"], "medicine_name": names.get(row["_id"]), "quantity": row["quantity"], "revenue": round(row["revenue"], 2)}
+        for row in rows
+    ]
+
+async def get_sales_report_db(store_id: int, db, mysql_db: AsyncSession, start_date=None, end_date=None, period: str = "day", top: int = 10):
+    """
+    Sales totals per period and the top medicines read from the daily rollup,
+    only the top medicines are name-resolved
+    """
+    try:
+        totals, tops = await asyncio.gather(
+            db.sales.aggregate(sales_totals_pipeline(store_id, start_date, end_date, period)).to_list(length=None),
+            db.daily_sales_rollup.aggregate(top_medicines_pipeline(store_id, start_date, end_date, top)).to_list(length=1)
+        )
+        report = {"totals": totals, **tops[0]}
+        medicine_ids = {row["_id"] for row in report["top_by_quantity"] + report["top_by_revenue"]}
+        names = await get_names_by_ids_async(ids=medicine_ids, model=MedicineMaster, field="medicine_id", name_field="medicine_name", db=mysql_db)
+        return {
+            "store_id": store_id,
+            "period": period,
+            "totals": [{"period": row["_id"], "sales": row["sales"], "revenue": round(row["revenue"], 2)} for row in report["totals"]],
+            "top_by_quantity": top_medicine_rows(report["top_by_quantity"], names),
+            "top_by_revenue": top_medicine_rows(report["top_by_revenue"], names)
+        }
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+async def get_purchase_report_db(store_id: int, db, mysql_db: AsyncSession, start_date=None, end_date=None, period: str = "day", top: int = 10):
+    """
+    Purchase spend per period and per distributor, only the listed distributors are name-resolved
+    """
+    try:
+        report = (await db.purchases.aggregate(purchase_report_pipeline(store_id, start_date, end_date, period, top)).to_list(length=1))[0]
+        names = await get_names_by_ids_async(ids={row["_id"] for row in report["distributors"]}, model=Distributor, field="distributor_id", name_field="distributor_name", db=mysql_db)
+        return {
+            "store_id": store_id,
+            "period": period,
+            "totals": [{"period": row["_id"], "purchases": row["purchases"], "spend": round(row["spend"], 2)} for row in report["totals"]],
+            "distributors": [
+                {"distributor_id": row["_id"], "distributor_name": names.get(row["_id"]), "purchases": row["purchases"], "spend": round(row["spend"], 2)}
+                for row in report["distributors"]
+            ]
+        }
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+async def get_order_status_report_db(store_id: int, db, start_date=None, end_date=None):
+    """
+    Order count and amount for every order status, statuses without orders included
+    """
+    try:
+        rows = await db.orders.aggregate([
+            {"$match": {"store_id": store_id, **date_range_match("order_date", start_date, end_date)}},
+            {"$group": {"_id": "$order_status", "orders": {"$sum": 1}, "amount": {"$sum": "$total_amount"}}}
+        ]).to_list(length=None)
+        counts = {row["_id"]: row for row in rows}
+        return {
+            "store_id": store_id,
+            "statuses": [
+                {"order_status": status.value, "orders": counts.get(status.value, {}).get("orders", 0), "amount": round(counts.get(status.value, {}).get("amount", 0), 2)}
+                for status in OrderStatus
+            ]
+        }
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
@@ -0,0 +1,129 @@
+from pymongo import UpdateOne
+from datetime import datetime, timedelta
+from typing import Optional
+import argparse
+import asyncio
+import logging
+import sys
+from ..db.mongodb import get_database
+from ..db.indexes import INDEXES
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# sale_date is stored as its string form, the rollups key on the day as a date
+SALE_DAY = {"$dateFromString": {"dateString": {"$substrBytes": ["$sale_date", 0, 10]}}}
+PURCHASE_DAY = {"$dateFromString": {"dateString": {"$dateToString": {"format": "%Y-%m-%d", "date": "$purchase_date"}}}}
+
+def day_of(value):
+    """
+    Midnight of a datetime, or of the date in a stored sale_date string
+    """
+    if isinstance(value, str):
+        return datetime.strptime(value[:10], "%Y-%m-%d")
+    return datetime(value.year, value.month, value.day)
+
+def rollup_updates(store_id: int, day: datetime, lines: dict, fields: tuple):
+    """
+    One $inc upsert per medicine of the day, lines maps medicine_id to the field increments
+    """
+    now = datetime.now()
+    return [
+        UpdateOne(
+            {"store_id": store_id, "day": day, "medicine_id": medicine_id},
+            {"$inc": {field: increments[field] for field in fields}, "$set": {"updated_at": now}},
+            upsert=True
+        )
+        for medicine_id, increments in lines.items()
+    ]
+
+def sale_rollup_updates(sale: dict, sign: int = 1):
+    """
+    daily_sales_rollup increments of a sale, sign -1 takes a deleted sale back out
+    """
+    lines = {}
+    for item in sale.get("sale_items", []):
+        line = lines.setdefault(item["medicine_id"], {"quantity": 0, "revenue": 0.0, "lines": 0})
+        line["quantity"] += sign * item["quantity"]
+        line["revenue"] += sign * item["quantity"] * item["price"]
+        line["lines"] += sign
+    return rollup_updates(sale["store_id"], day_of(sale["sale_date"]), lines, ("quantity", "revenue", "lines"))
+
+def purchase_rollup_updates(purchase: dict, sign: int = 1):
+    """
+    daily_purchase_rollup increments of a purchase, sign -1 takes a deleted purchase back out
+    """
+    lines = {}
+    for item in purchase.get("purchase_items", []):
+        line = lines.setdefault(item["medicine_id"], {"quantity": 0, "spend": 0.0, "lines": 0})
+        line["quantity"] += sign * item["purchase_quantity"]
+        line["spend"] += sign * item["purchase_amount"]
+        line["lines"] += sign
+    return rollup_updates(purchase["store_id"], day_of(purchase["purchase_date"]), lines, ("quantity", "spend", "lines"))
+
+def window_match(field: str, store_id: Optional[int], start_date: Optional[datetime], end_date: Optional[datetime], as_string: bool = False):
+    """
+    Store and [start_date, end_date) condition on a raw date field or on the rollup day
+    """
+    query = {"active_flag": 1} if field != "day" else {}
+    if store_id is not None:
+        query["store_id"] = store_id
+    condition = {}
+    if start_date:
+        condition["$gte"] = start_date.strftime("%Y-%m-%d") if as_string else start_date
+    if end_date:
+        condition["$lt"] = end_date.strftime("%Y-%m-%d") if as_string else end_date
+    if condition:
+        query[field] = condition
+    return query
+
+def rebuild_pipeline(match: dict, day, items: str, sums: dict, target: str):
+    """
+    Aggregate the active raw documents per (store_id, day, medicine_id) and merge them into the rollup
+    """
+    return [
+        {"$match": match},
+        {"$unwind": f"${items}"},
+        {"$group": {"_id": {"store_id": "$store_id", "day": day, "medicine_id": f"${items}.medicine_id"}, **sums, "lines": {"$sum": 1}}},
+        {"$project": {
+            "_id": 0, "store_id": "$_id.store_id", "day": "$_id.day", "medicine_id": "$_id.medicine_id",
+            **{field: 1 for field in sums}, "lines": 1, "updated_at": "$$NOW"
+        }},
+        {"$merge": {"into": target, "on": ["store_id", "day", "medicine_id"], "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]
+
+async def rebuild_rollups_db(db, store_id: Optional[int] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
+    """
+    Backfill or reconcile both rollups over a window from the raw sales and purchases.
+    The window rows are dropped and recomputed, run it when the store is not writing.
+    """
+    rollups = [
+        ("daily_sales_rollup", "sales", window_match("sale_date", store_id, start_date, end_date, as_string=True), SALE_DAY, "sale_items",
+         {"quantity": {"$sum": "$sale_items.quantity"}, "revenue": {"$sum": {"$multiply": ["$sale_items.quantity", "$sale_items.price"]}}}),
+        ("daily_purchase_rollup", "purchases", window_match("purchase_date", store_id, start_date, end_date), PURCHASE_DAY, "purchase_items",
+         {"quantity": {"$sum": "$purchase_items.purchase_quantity"}, "spend": {"$sum": "$purchase_items.purchase_amount"}}),
+    ]
+    rebuilt = {}
+    for target, source, match, day, items, sums in rollups:
+        # $merge needs the unique (store_id, day, medicine_id) index
+        await db[target].create_indexes(INDEXES[target])
+        removed = await db[target].delete_many(window_match("day", store_id, start_date, end_date))
+        await db[source].aggregate(rebuild_pipeline(match, day, items, sums, target)).to_list(length=None)
+        rebuilt[target] = await db[target].count_documents(window_match("day", store_id, start_date, end_date))
+        logger.info(f"{target} rebuilt: {removed.deleted_count} rows dropped, {rebuilt[target]} rows written")
+    return rebuilt
+
+async def main(argv):
+    parser = argparse.ArgumentParser(description="Rebuild the daily sales and purchase rollups")
+    parser.add_argument("--store", type=int, help="only this store")
+    parser.add_argument("--from", dest="start_date", help="first day, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end_date", help="last day included, YYYY-MM-DD")
+    args = parser.parse_args(argv)
+    start_date = datetime.strptime(args.start_date, "%Y-%m-%d") if args.start_date else None
+    end_date = datetime.strptime(args.end_date, "%Y-%m-%d") + timedelta(days=1) if args.end_date else None
+    await rebuild_rollups_db(get_database(), args.store, start_date, end_date)
+
+if __name__ == "__main__":
+    # python -m istore.app.crud.rollups [--store N] [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+    asyncio.run(main(sys.argv[1:]))
@@ -1,38 +1,102 @@
 from fastapi import Depends, HTTPException
 from bson import ObjectId
 from typing import List
-from ..db.mongodb import get_database
+from ..db.mongodb import get_database, run_in_transaction
+from .rollups import sale_rollup_updates
 from ..models.store_mongodb_models import Sale
 import logging
 from datetime import datetime
+from typing import Optional
+from ..db.mysql import AsyncSessionLocal
+from ..models.store_mysql_models import MedicineMaster
+from ..utils import get_page_limit, cursor_query, parse_fields, build_page, batched, get_names_by_ids_async, get_customers_by_ids, EXPORT_BATCH_SIZE
 
 # Configure logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+async def write_sale_db(sale, db, session):
+    """
+    Insert the sale and add it to the daily rollup, in the session of the caller
+    """
+    await db["sales"].insert_one(sale, session=session)
+    rollup = sale_rollup_updates(sale)
+    if rollup:
+        await db.daily_sales_rollup.bulk_write(rollup, ordered=False, session=session)
+
 async def create_sale_collection_db(sale, db):
     """
     Creating the sale collection in the database.
     """
     try:
-        await db["sales"].insert_one(sale)
+        await run_in_transaction(db, lambda session: write_sale_db(sale, db, session))
         return sale
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
     
-async def read_sales_db(store_id: int, db):
+async def read_sales_db(store_id: int, db, limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None):
+    """
+    Get a page of the store sales ordered by _id
+    """
     try:
-        sales = []
-        async for sale in db.sales.find({"store_id": store_id, "active_flag":1}):
-            sale["_id"] = str(sale["_id"])
-            sales.append(sale)
-        
-        return sales
+        limit = get_page_limit(limit)
+        fields = parse_fields(fields)
+        projection = {field: 1 for field in fields} if fields else None
+        query = cursor_query({"store_id": store_id, "active_flag": 1}, cursor)
+        sales = await db.sales.find(query, projection).sort("_id", 1).limit(limit + 1).to_list(length=None)
+        next_id = sales[limit - 1]["_id"] if len(sales) > limit else None
+        return build_page(sales[:limit], next_id)
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
+# one row per sale line
+SALE_EXPORT_COLUMNS = [
+    "sale_id", "invoice_id", "sale_date", "store_id", "customer_id", "customer_name", "total_amount",
+    "medicine_id", "medicine_name", "batch_id", "expiry_date", "quantity", "price"
+]
+
+async def stream_sale_rows_db(store_id: int, db, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
+    """
+    Yield the sale lines of the store in sale_date order, a cursor batch at a time.
+    Uses its own MySQL session, the request one is closed before the body is streamed.
+    """
+    query = {"store_id": store_id, "active_flag": 1}
+    if start_date or end_date:
+        # sale_date is stored as its string form, which sorts like the date
+        query["sale_date"] = {}
+        if start_date:
+            query["sale_date"]["$gte"] = start_date.strftime('%Y-%m-%d')
+        if end_date:
+            query["sale_date"]["$lt"] = end_date.strftime('%Y-%m-%d')
+    cursor = db.sales.find(query).sort([("sale_date", 1), ("_id", 1)]).batch_size(EXPORT_BATCH_SIZE)
+    async with AsyncSessionLocal() as mysql_db:
+        async for sales in batched(cursor):
+            customers = await get_customers_by_ids([sale.get("customer_id") for sale in sales], db, projection={"name": 1})
+            medicine_names = await get_names_by_ids_async(
+                ids={item["medicine_id"] for sale in sales for item in sale.get("sale_items", [])},
+                model=MedicineMaster, field="medicine_id", name_field="medicine_name", db=mysql_db
+            )
+            for sale in sales:
+                customer = customers.get(str(sale.get("customer_id"))) or {}
+                for item in sale.get("sale_items", []):
+                    yield {
+                        "sale_id": str(sale["_id"]),
+                        "invoice_id": sale.get("invoice_id"),
+                        "sale_date": sale["sale_date"],
+                        "store_id": store_id,
+                        "customer_id": sale.get("customer_id"),
+                        "customer_name": customer.get("name"),
+                        "total_amount": sale["total_amount"],
+                        "medicine_id": item["medicine_id"],
+                        "medicine_name": medicine_names.get(item["medicine_id"]),
+                        "batch_id": item.get("batch_id"),
+                        "expiry_date": item.get("expiry_date"),
+                        "quantity": item["quantity"],
+                        "price": item.get("price")
+                    }
+
 async def get_sale_particular_db(sale_id: str, db):
     """
     Get sale particular
@@ -40,7 +104,6 @@ async def get_sale_particular_db(sale_id: str, db):
     try:
         result = await db["sales"].find_one({"_id": ObjectId(sale_id)})
         if result:
-            result["_id"] = str(result["_id"])
             return result
         raise HTTPException(status_code=404, detail="Sale not found")
     except Exception as e:
@@ -52,8 +115,15 @@ async def delete_sale_collection_db(sale_id: str, db):
     Deleting the sale collection from the database.
     """
     try:
-        delete_result = await db.sales.update_one({"_id": ObjectId(sale_id)}, {"$set": {"active_flag": 0}})
-        if delete_result.modified_count == 1:
+        async def soft_delete(session):
+            sale = await db.sales.find_one_and_update({"_id": ObjectId(sale_id), "active_flag": {"$ne": 0}}, {"$set": {"active_flag": 0}}, session=session)
+            if sale:
+                rollup = sale_rollup_updates(sale, sign=-1)
+                if rollup:
+                    await db.daily_sales_rollup.bulk_write(rollup, ordered=False, session=session)
+            return sale
+
+        if await run_in_transaction(db, soft_delete):
             return {
                 "sale_id": sale_id,
                 "message": "Sale order deleted successfully"
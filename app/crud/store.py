@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from ..models.store_mysql_models import StoreDetails as StoreDetailsModel
 from ..schemas.StoreDetailsSchema import StoreDetailsCreate, StoreDetails, UpdateStoreMobile
+from ..utils import invalidate_master_cache
 import logging
 from typing import List
 from datetime import datetime
@@ -20,6 +21,7 @@ def create_store_record_db(db_store , db: Session = get_db):
         db.add(db_store)
         db.commit()
         db.refresh(db_store)
+        invalidate_master_cache(StoreDetailsModel)
         return db_store
     except SQLAlchemyError as e:
         db.rollback()
@@ -81,6 +83,7 @@ def suspend_activate_store_db(mobile: str, remarks_text: str, active_flag_store:
             store.updated_at = datetime.now()
             db.commit()
             db.refresh(store)
+            invalidate_master_cache(StoreDetailsModel)
             return store
         else:
             raise HTTPException(status_code=404, detail="Store not found")
@@ -102,6 +105,7 @@ def verify_stores_db(mobile: str, verification: str, db: Session = Depends(get_d
                 store.active_flag = 1
             db.commit()
             db.refresh(store)
+            invalidate_master_cache(StoreDetailsModel)
             return store
         else:
             raise HTTPException(status_code=404, detail="Store not found")
@@ -139,6 +143,7 @@ def update_store_record_db(store: UpdateStoreMobile, db: Session):
             
             db.commit()
             db.refresh(db_store)
+            invalidate_master_cache(StoreDetailsModel)
             return db_store
         else:
             raise HTTPException(status_code=404, detail="Store not found")
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+from pymongo import ASCENDING, IndexModel
+from .mongodb import get_database
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Create the indexes when the app starts
+ENSURE_INDEXES_ON_STARTUP = os.getenv("MONGO_ENSURE_INDEXES", "true").lower() in ("1", "true", "yes")
+
+# Indexes backing the hot queries, applied idempotently by ensure_indexes
+INDEXES = {
+    "stocks": [
+        IndexModel([("store_id", ASCENDING), ("medicine_id", ASCENDING)], name="store_medicine"),
+        IndexModel([("store_id", ASCENDING), ("_id", ASCENDING)], name="store_page"),
+        # expiry sweeper across stores and the per store expiring report
+        IndexModel([("batch_details.expiry_date", ASCENDING)], name="batch_expiry"),
+        IndexModel([("store_id", ASCENDING), ("batch_details.expiry_date", ASCENDING)], name="store_batch_expiry"),
+    ],
+    "stock_batches": [
+        # FEFO reads of the sale path and the per medicine batch listings
+        IndexModel([("store_id", ASCENDING), ("medicine_id", ASCENDING), ("expiry_date", ASCENDING)], name="store_medicine_expiry"),
+        IndexModel([("expiry_date", ASCENDING)], name="expiry"),
+        IndexModel([("store_id", ASCENDING), ("expiry_date", ASCENDING)], name="store_expiry"),
+    ],
+    "stock_batches_archive": [
+        IndexModel([("store_id", ASCENDING), ("medicine_id", ASCENDING)], name="store_medicine"),
+    ],
+    "pricing": [
+        IndexModel([("store_id", ASCENDING), ("medicine_id", ASCENDING), ("active_flag", ASCENDING)], name="store_medicine_active"),
+    ],
+    "purchases": [
+        IndexModel([("store_id", ASCENDING), ("active_flag", ASCENDING), ("purchase_date", ASCENDING)], name="store_active_date"),
+        IndexModel([("store_id", ASCENDING), ("active_flag", ASCENDING), ("_id", ASCENDING)], name="store_active_page"),
+        IndexModel([("store_id", ASCENDING), ("purchase_items.medicine_id", ASCENDING)], name="store_item_medicine"),
+    ],
+    "sales": [
+        IndexModel([("store_id", ASCENDING), ("sale_items.medicine_id", ASCENDING)], name="store_item_medicine"),
+        IndexModel([("store_id", ASCENDING), ("active_flag", ASCENDING), ("_id", ASCENDING)], name="store_active_page"),
+        IndexModel([("store_id", ASCENDING), ("active_flag", ASCENDING), ("sale_date", ASCENDING)], name="store_active_date"),
+    ],
+    "inventory_view": [
+        IndexModel([("store_id", ASCENDING), ("medicine_id", ASCENDING)], name="store_medicine", unique=True),
+        IndexModel([("store_id", ASCENDING), ("_id", ASCENDING)], name="store_page"),
+    ],
+    "reorder_points": [
+        IndexModel([("store_id", ASCENDING), ("medicine_id", ASCENDING)], name="store_medicine", unique=True),
+        IndexModel([("store_id", ASCENDING), ("_id", ASCENDING)], name="store_page"),
+        IndexModel([("store_id", ASCENDING), ("needs_reorder", ASCENDING), ("_id", ASCENDING)], name="store_reorder_page"),
+    ],
+    "daily_sales_rollup": [
+        IndexModel([("store_id", ASCENDING), ("day", ASCENDING), ("medicine_id", ASCENDING)], name="store_day_medicine", unique=True),
+    ],
+    "daily_purchase_rollup": [
+        IndexModel([("store_id", ASCENDING), ("day", ASCENDING), ("medicine_id", ASCENDING)], name="store_day_medicine", unique=True),
+    ],
+    "orders": [
+        IndexModel([("store_id", ASCENDING), ("order_status", ASCENDING), ("_id", ASCENDING)], name="store_status_page"),
+        IndexModel([("store_id", ASCENDING), ("order_date", ASCENDING)], name="store_date"),
+    ],
+}
+
+# Query shapes of the crud modules, explained by the index report
+QUERY_SHAPES = [
+    {"collection": "stocks", "filter": {"store_id": 1, "medicine_id": 1}},
+    {"collection": "stocks", "filter": {"store_id": 1}, "sort": {"_id": 1}},
+    {"collection": "stocks", "filter": {"batch_details": {"$elemMatch": {"expiry_date": {"$lte": datetime(2024, 1, 31)}, "is_active": 1}}}},
+    {"collection": "stocks", "filter": {"store_id": 1, "batch_details": {"$elemMatch": {"expiry_date": {"$lte": datetime(2024, 1, 31)}, "is_active": 1}}}},
+    {"collection": "stock_batches", "filter": {"store_id": 1, "medicine_id": {"$in": [1, 2]}, "is_active": 1, "batch": {"$gt": 0}, "expiry_date": {"$gt": datetime(2024, 1, 31)}}, "sort": {"medicine_id": 1, "expiry_date": 1}},
+    {"collection": "stock_batches", "filter": {"is_active": 1, "expiry_date": {"$lte": datetime(2024, 1, 31)}}},
+    {"collection": "pricing", "filter": {"store_id": 1, "medicine_id": 1, "active_flag": 1}},
+    {"collection": "purchases", "filter": {"store_id": 1, "active_flag": 1}, "sort": {"_id": 1}},
+    {"collection": "purchases", "filter": {"store_id": 1, "active_flag": 1, "purchase_date": {"$gte": datetime(2024, 1, 1), "$lte": datetime(2024, 12, 31)}}},
+    {"collection": "purchases", "filter": {"store_id": 1, "purchase_items.medicine_id": 1}},
+    {"collection": "sales", "filter": {"store_id": 1, "sale_items.medicine_id": 1}},
+    {"collection": "sales", "filter": {"store_id": 1, "active_flag": 1}, "sort": {"_id": 1}},
+    {"collection": "sales", "filter": {"store_id": 1, "active_flag": 1, "sale_date": {"$gte": "2024-01-01", "$lt": "2025-01-01"}}, "sort": {"sale_date": 1}},
+    {"collection": "inventory_view", "filter": {"store_id": 1}, "sort": {"_id": 1}},
+    {"collection": "reorder_points", "filter": {"store_id": 1, "needs_reorder": True}, "sort": {"_id": 1}},
+    {"collection": "orders", "filter": {"store_id": 1, "order_status": "pending"}, "sort": {"_id": 1}},
+]
+
+async def ensure_indexes(db):
+    """
+    Create the registered indexes, existing ones are left untouched
+    """
+    created = {}
+    for collection, indexes in INDEXES.items():
+        created[collection] = await db[collection].create_indexes(indexes)
+        logger.info(f"Indexes ensured on {collection}: {created[collection]}")
+    return created
+
+def plan_stages(plan):
+    """
+    All the stages of a query plan tree
+    """
+    stages = [plan.get("stage")]
+    for child in plan.get("inputStages", []) + [plan[key] for key in ("inputStage", "queryPlan") if key in plan]:
+        stages.extend(plan_stages(child))
+    return stages
+
+async def index_report(db):
+    """
+    Index usage counters and the winning plan of every registered query shape
+    """
+    usage = {}
+    for collection in INDEXES:
+        stats = await db[collection].aggregate([{"$indexStats": {}}]).to_list(length=None)
+        usage[collection] = {stat["name"]: stat["accesses"]["ops"] for stat in stats}
+
+    shapes = []
+    for shape in QUERY_SHAPES:
+        command = {"find": shape["collection"], "filter": shape["filter"]}
+        if "sort" in shape:
+            command["sort"] = shape["sort"]
+        explain = await db.command("explain", command, verbosity="queryPlanner")
+        stages = plan_stages(explain["queryPlanner"]["winningPlan"])
+        shapes.append({
+            **shape,
+            "stages": stages,
+            "collection_scan": "COLLSCAN" in stages
+        })
+    return {"index_usage": usage, "query_shapes": shapes}
+
+async def main(argv):
+    db = get_database()
+    if "--report" in argv:
+        report = await index_report(db)
+        print(json.dumps(report, indent=2, default=str))
+        for shape in report["query_shapes"]:
+            if shape["collection_scan"]:
+                logger.warning(f"Collection scan on {shape['collection']} for {shape['filter']}")
+    else:
+        await ensure_indexes(db)
+
+if __name__ == "__main__":
+    # python -m istore.app.db.indexes [--report]
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,169 @@
+from contextvars import ContextVar
+from pymongo import monitoring
+from sqlalchemy import event
+from .nplusone import NPLUSONE_ENABLED, ShapeCounter, sql_shape, mongo_shape, report
+import logging
+import threading
+import time
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("mysql", "mongo")
+
+class RequestMetrics:
+    """
+    Wall time and per backend query count and time of one request
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.queries = {backend: 0 for backend in BACKENDS}
+        self.query_time = {backend: 0.0 for backend in BACKENDS}
+        self.shapes = ShapeCounter() if NPLUSONE_ENABLED else None
+
+    def record_shape(self, backend: str, shape: str):
+        with self._lock:
+            self.shapes.add(backend, shape)
+
+    def record(self, backend: str, duration: float):
+        # Motor commands finish on its executor threads
+        with self._lock:
+            self.queries[backend] += 1
+            self.query_time[backend] += duration
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self):
+        """
+        Server-Timing header value, durations in milliseconds
+        """
+        with self._lock:
+            parts = [f"app;dur={self.elapsed() * 1000:.1f}"]
+            for backend in BACKENDS:
+                parts.append(f'{backend};dur={self.query_time[backend] * 1000:.1f};desc="{self.queries[backend]} queries"')
+        return ", ".join(parts)
+
+# metrics of the request being served. Motor runs each operation, and pymongo publishes its
+# command events, on an executor thread started with a copy of the caller's context
+# (motor.frameworks.asyncio.run_on_executor, Motor 2.3 and later), so the listener sees it
+current_request = ContextVar("current_request", default=None)
+
+class MetricsRegistry:
+    """
+    Process wide request and query totals per route, rendered in the Prometheus text format
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.request_time = {}
+        self.queries = {}
+        self.query_time = {}
+
+    def observe(self, method: str, route: str, status: int, metrics: RequestMetrics):
+        with self._lock:
+            key = (method, route, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.request_time[(method, route)] = self.request_time.get((method, route), 0.0) + metrics.elapsed()
+            for backend in BACKENDS:
+                key = (method, route, backend)
+                self.queries[key] = self.queries.get(key, 0) + metrics.queries[backend]
+                self.query_time[key] = self.query_time.get(key, 0.0) + metrics.query_time[backend]
+
+    def render(self):
+        with self._lock:
+            lines = [
+                "# HELP istore_requests_total Requests served per route and status.",
+                "# TYPE istore_requests_total counter"
+            ]
+            for (method, route, status), value in sorted(self.requests.items()):
+                lines.append(f'istore_requests_total{{method="{method}",route="{route}",status="{status}"}} {value}')
+            lines += [
+                "# HELP istore_request_duration_seconds_total Wall time spent per route.",
+                "# TYPE istore_request_duration_seconds_total counter"
+            ]
+            for (method, route), value in sorted(self.request_time.items()):
+                lines.append(f'istore_request_duration_seconds_total{{method="{method}",route="{route}"}} {value:.6f}')
+            lines += [
+                "# HELP istore_db_queries_total MySQL statements and Mongo commands per route.",
+                "# TYPE istore_db_queries_total counter"
+            ]
+            for (method, route, backend), value in sorted(self.queries.items()):
+                lines.append(f'istore_db_queries_total{{method="{method}",route="{route}",backend="{backend}"}} {value}')
+            lines += [
+                "# HELP istore_db_query_duration_seconds_total Time spent in the database per route.",
+                "# TYPE istore_db_query_duration_seconds_total counter"
+            ]
+            for (method, route, backend), value in sorted(self.query_time.items()):
+                lines.append(f'istore_db_query_duration_seconds_total{{method="{method}",route="{route}",backend="{backend}"}} {value:.6f}')
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+def record_query(backend: str, duration: float):
+    """
+    Add a query to the request being served, queries outside a request are ignored
+    """
+    metrics = current_request.get()
+    if metrics is not None:
+        metrics.record(backend, duration)
+
+def record_shape(backend: str, shape):
+    """
+    Count a query shape for the N+1 detector when it is enabled
+    """
+    metrics = current_request.get()
+    if shape is not None and metrics is not None and metrics.shapes is not None:
+        metrics.record_shape(backend, shape)
+
+def instrument_engine(engine):
+    """
+    Time every statement of a SQLAlchemy engine, pass async_engine.sync_engine for the async one
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if NPLUSONE_ENABLED:
+            record_shape("mysql", sql_shape(statement))
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record_query("mysql", time.perf_counter() - conn.info["query_start"].pop())
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """
+    Time every command the Motor client sends
+    """
+    def started(self, event):
+        if NPLUSONE_ENABLED:
+            record_shape("mongo", mongo_shape(event.command_name, event.command))
+
+    def succeeded(self, event):
+        record_query("mongo", event.duration_micros / 1_000_000)
+
+    def failed(self, event):
+        record_query("mongo", event.duration_micros / 1_000_000)
+
+command_listener = CommandMetricsListener()
+
+async def timing_middleware(request, call_next):
+    """
+    Time the request and its queries, answered with a Server-Timing header.
+    Repeated query shapes are reported here when the N+1 detector is on.
+    """
+    metrics = RequestMetrics()
+    token = current_request.set(metrics)
+    status = 500
+    try:
+        response = await call_next(request)
+        if metrics.shapes is not None:
+            report(request.method, request.url.path, metrics.shapes.offenders())
+        status = response.status_code
+        response.headers["Server-Timing"] = metrics.server_timing()
+        return response
+    finally:
+        current_request.reset(token)
+        route = request.scope.get("route")
+        registry.observe(request.method, route.path if route is not None else "unmatched", status, metrics)
@@ -1,7 +1,11 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
 import os
 import logging
+import threading
+import time
 from dotenv import load_dotenv
+from .metrics import command_listener
 
 #load enviroment variables
 load_dotenv()
@@ -14,8 +18,111 @@ logger = logging.getLogger(__name__)
 MONGO_DETAILS = os.getenv("DATABASE_URL", "mongodb://localhost:27017")
 collection_name = os.getenv("COLLECTION_NAME", "istores")
 
+# Connection pool settings
+MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "30000"))
+# Multi-document transactions need a replica set or a mongos. "auto" asks the server once,
+# a standalone mongod then gets the guarded writes that are undone on a failure instead
+MONGO_TRANSACTIONS = os.getenv("MONGO_TRANSACTIONS", "auto").lower()
+USE_TRANSACTIONS = None if MONGO_TRANSACTIONS == "auto" else MONGO_TRANSACTIONS in ("1", "true", "yes")
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """
+    Tracks open and checked out connections and checkout wait times of the Motor pool
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # the checkout start and its result are published from the same thread
+        self._started = threading.local()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checkout_timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.pool_cleared = 0
+
+    def _waited(self):
+        start = getattr(self._started, "value", None)
+        self._started.value = None
+        return time.perf_counter() - start if start is not None else 0.0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def connection_check_out_started(self, event):
+        self._started.value = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self._waited()
+        with self._lock:
+            self.checkout_failures += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.checkout_timeouts += 1
+
+    def connection_checked_out(self, event):
+        waited = self._waited()
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def status(self):
+        with self._lock:
+            return {
+                "max_pool_size": MAX_POOL_SIZE,
+                "min_pool_size": MIN_POOL_SIZE,
+                "open": self.open_connections,
+                "checked_out": self.checked_out,
+                "idle": max(self.open_connections - self.checked_out, 0),
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "checkout_timeouts": self.checkout_timeouts,
+                "pool_cleared": self.pool_cleared,
+                "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3)
+            }
+
+pool_listener = PoolMetricsListener()
+
 try:
-    client = AsyncIOMotorClient(MONGO_DETAILS)
+    client = AsyncIOMotorClient(
+        MONGO_DETAILS,
+        maxPoolSize=MAX_POOL_SIZE,
+        minPoolSize=MIN_POOL_SIZE,
+        maxIdleTimeMS=MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=WAIT_QUEUE_TIMEOUT_MS,
+        event_listeners=[pool_listener, command_listener]
+    )
     database = client[collection_name]
     logger.info("Successfully connected to the MongoDB.")
 except Exception as e:
@@ -27,3 +134,35 @@ def get_database():
         logger.error("Database connection is not established.")
         raise RuntimeError("Database connection is not established.")
     return database
+
+async def transactions_supported(db):
+    """
+    Whether the server takes multi-document transactions, asked once with hello when
+    MONGO_TRANSACTIONS is auto. A failed check is not kept, the next call asks again.
+    """
+    global USE_TRANSACTIONS
+    if USE_TRANSACTIONS is None:
+        try:
+            hello = await db.client.admin.command("hello")
+        except Exception as e:
+            logger.error(f"Error checking MongoDB transaction support: {str(e)}")
+            return False
+        USE_TRANSACTIONS = "setName" in hello or hello.get("msg") == "isdbgrid"
+        logger.info(f"MongoDB transactions {'enabled' if USE_TRANSACTIONS else 'disabled, the server is a standalone mongod'}")
+    return USE_TRANSACTIONS
+
+async def run_in_transaction(db, callback):
+    """
+    Run callback(session) in a multi-document transaction, retried on transient errors.
+    Without transaction support the callback gets no session.
+    """
+    if not await transactions_supported(db):
+        return await callback(None)
+    async with await db.client.start_session() as session:
+        return await session.with_transaction(callback)
+
+def get_pool_status():
+    """
+    Connection pool status of the Motor client
+    """
+    return pool_listener.status()
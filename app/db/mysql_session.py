@@ -1,7 +1,2 @@
-from .mysql import SessionLocal
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+# the session dependencies live in mysql.py, re-exported so every router depends on the same callables
+from .mysql import get_db, get_async_db
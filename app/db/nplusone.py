@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+import re
+import traceback
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# off, log or raise, raise is meant for development and CI
+NPLUSONE_MODE = os.getenv("NPLUSONE_MODE", "off").lower()
+# a query shape may run this many times per request before it is reported
+NPLUSONE_THRESHOLD = int(os.getenv("NPLUSONE_THRESHOLD", "5"))
+NPLUSONE_ENABLED = NPLUSONE_MODE in ("log", "raise")
+
+# driver and session housekeeping, not issued by the crud code
+IGNORED_COMMANDS = {
+    "getMore", "killCursors", "endSessions", "hello", "isMaster", "ismaster", "ping", "buildInfo",
+    "saslStart", "saslContinue", "commitTransaction", "abortTransaction"
+}
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class NPlusOneError(RuntimeError):
+    """
+    Raised at the end of a request that repeated a query shape in raise mode
+    """
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s|:\w+|\?")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+
+def sql_shape(statement: str):
+    """
+    Statement with the literals, placeholders and IN lists collapsed
+    """
+    shape = _LITERALS.sub("?", statement)
+    shape = _IN_LIST.sub("IN (?)", shape)
+    return " ".join(shape.split())
+
+def value_shape(value):
+    """
+    Keys of a Mongo filter with every value replaced by ?
+    """
+    if isinstance(value, dict):
+        return {key: value_shape(item) for key, item in value.items()}
+    if isinstance(value, list) and value and isinstance(value[0], dict):
+        return [value_shape(item) for item in value]
+    return "?"
+
+def mongo_shape(command_name: str, command: dict):
+    """
+    Command, collection and filter keys of a Mongo command, None for the housekeeping ones
+    """
+    if command_name in IGNORED_COMMANDS:
+        return None
+    collection = command.get(command_name)
+    if command_name == "aggregate":
+        body = value_shape(command.get("pipeline", []))
+    elif command_name in ("update", "delete"):
+        body = [value_shape(statement.get("q", {})) for statement in command.get("updates", command.get("deletes", []))]
+    elif command_name == "insert":
+        body = None
+    else:
+        body = value_shape(command.get("filter", command.get("query", {})))
+    return f"{command_name} {collection} {body}"
+
+def call_site():
+    """
+    Application frames that issued the query, outermost first
+    """
+    frames = [
+        f"{frame.filename}:{frame.lineno} in {frame.name}"
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(APP_DIR) and not frame.filename.startswith(DB_DIR)
+    ]
+    if frames:
+        return frames
+    # the async session runs its statements in a greenlet, follow the awaiting coroutines instead
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        # Motor commands start on its executor threads, away from the request task
+        return []
+    coro = task.get_coro() if task is not None else None
+    while coro is not None and getattr(coro, "cr_frame", None) is not None:
+        code = coro.cr_frame.f_code
+        if code.co_filename.startswith(APP_DIR) and not code.co_filename.startswith(DB_DIR):
+            frames.append(f"{code.co_filename}:{coro.cr_frame.f_lineno} in {code.co_name}")
+        coro = coro.cr_await
+    return frames
+
+class ShapeCounter:
+    """
+    Query shapes of one request, with the call site of the first repeat over the threshold
+    """
+    def __init__(self, threshold: int = NPLUSONE_THRESHOLD):
+        self.threshold = threshold
+        self.counts = {}
+        self.call_sites = {}
+
+    def add(self, backend: str, shape: str):
+        key = (backend, shape)
+        count = self.counts.get(key, 0) + 1
+        self.counts[key] = count
+        if count == self.threshold + 1:
+            self.call_sites[key] = call_site()
+
+    def offenders(self):
+        return [
+            {"backend": backend, "shape": shape, "count": count, "call_site": self.call_sites.get((backend, shape), [])}
+            for (backend, shape), count in self.counts.items()
+            if count > self.threshold
+        ]
+
+def report(method: str, path: str, offenders: list):
+    """
+    Log the repeated query shapes of a request, or raise them in raise mode
+    """
+    if not offenders:
+        return
+    lines = [f"N+1 queries in {method} {path}:"]
+    for offender in offenders:
+        lines.append(f"  {offender['count']}x {offender['backend']}: {offender['shape']}")
+        lines.extend(f"    {site}" for site in offender["call_site"] or ["call site unavailable"])
+    message = "\n".join(lines)
+    if NPLUSONE_MODE == "raise":
+        raise NPlusOneError(message)
+    logger.warning(message)
@@ -1,26 +1,25 @@
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from starlette.exceptions import HTTPException as StarletteHTTPException
-from .routers import category, store, distributor, manufacturer, medicinemaster, purchase, pricing, orders, stocks, sales
-from fastapi.encoders import jsonable_encoder
-from bson import ObjectId
+from .routers import category, store, distributor, manufacturer, medicinemaster, purchase, pricing, orders, stocks, sales, reports
+import asyncio
 import logging
+from .utils import get_master_cache_stats
+from .db import mysql, mongodb
+from .db.metrics import timing_middleware, registry
+from .db.indexes import ENSURE_INDEXES_ON_STARTUP, ensure_indexes, index_report
+from .crud.expiry import EXPIRY_SWEEP_INTERVAL, run_expiry_sweeper
 
+# orjson for every response, ObjectId, Decimal and datetime included
 app = FastAPI()
 
-# Custom JSON encoder for ObjectId
-def json_encoder(obj):
-    if isinstance(obj, ObjectId):
-        return str(obj)
-    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
-
 # Configure logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-# Override default JSONEncoder with custom JSONEncoder
-app.json_encoder = json_encoder
+# Server-Timing header and the /metrics counters
+app.middleware("http")(timing_middleware)
 
 #mySQl
 
@@ -36,15 +35,55 @@ app.include_router(pricing.router, prefix="/storeapi", tags=["Pricing"])
 app.include_router(orders.router, prefix="/storeapi", tags=["Orders"])
 app.include_router(stocks.router, prefix="/storeapi", tags=["Stocks"])
 app.include_router(sales.router, prefix="/storeapi", tags=["Sales"])
+app.include_router(reports.router, prefix="/storeapi", tags=["Reports"])
 
 @app.get("/health", tags=["Health"])
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/health/pools", tags=["Health"])
+def pool_health():
+    return {
+        "mysql": mysql.get_pool_status(),
+        "mongodb": mongodb.get_pool_status()
+    }
+
+@app.get("/health/indexes", tags=["Health"])
+async def index_health():
+    return await index_report(mongodb.get_database())
+
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+def metrics():
+    return registry.render()
+
+@app.get("/health/cache", tags=["Health"])
+def master_cache_stats():
+    return get_master_cache_stats()
+
 # Startup Event
 @app.on_event("startup")
 async def on_startup():
     logger.info("App is starting...")
+    if ENSURE_INDEXES_ON_STARTUP:
+        try:
+            await ensure_indexes(mongodb.get_database())
+        except Exception as e:
+            logger.error(f"Error creating the MongoDB indexes: {str(e)}")
+    await mongodb.transactions_supported(mongodb.get_database())
+    # expiry housekeeping runs in the background, off the sale path
+    if EXPIRY_SWEEP_INTERVAL > 0:
+        app.state.expiry_sweeper = asyncio.create_task(run_expiry_sweeper(mongodb.get_database()))
+
+# Shutdown Event
+@app.on_event("shutdown")
+async def on_shutdown():
+    sweeper = getattr(app.state, "expiry_sweeper", None)
+    if sweeper is not None:
+        sweeper.cancel()
+        try:
+            await sweeper
+        except asyncio.CancelledError:
+            pass
 # Initialize database connection
 @app.get("/")
 def read_root():
@@ -80,6 +80,7 @@ class MedicineMaster(Base):
     updated_at = Column(DateTime, doc="medicine updated at")
     active_flag = Column(Integer, doc="0 or 1")
     composition = Column(String(255), doc="Composition of the medicine")
+    composition_key = Column(String(255), index=True, doc="Normalised composition for the substitute lookup")
     manufacturer = relationship("Manufacturer", back_populates="medicines")
     category = relationship("Category", back_populates="medicines")
     
@@ -8,6 +8,7 @@ from ..Service.orders import create_order_collection, get_order_collection, dele
 from ..db.mysql_session import get_db
 from sqlalchemy.orm import Session
 from ..schemas.Order import DeleteOrder
+from ..utils import MongoJSONResponse
 
 router = APIRouter()
 
@@ -28,25 +29,25 @@ async def create_order(order: Order, db=Depends(get_database)):
 async def get_all_orders(store_id:int, db=Depends(get_database)):
     try:
         orders = await get_order_collection(store_id=store_id, db=db)
-        return orders
+        return MongoJSONResponse(orders)
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
 @router.get("/orders/pending/", status_code=status.HTTP_200_OK)
-async def get_all_orders(store_id:int, db=Depends(get_database)):
+async def get_all_orders(store_id:int, db=Depends(get_database), limit:int=None, cursor:str=None, fields:str=None):
     try:
-        orders = await get_order_collection_pending(store_id=store_id, db=db)
-        return orders
+        orders = await get_order_collection_pending(store_id=store_id, db=db, limit=limit, cursor=cursor, fields=fields)
+        return MongoJSONResponse(orders)
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
 @router.get("/orders/delivered/", status_code=status.HTTP_200_OK)
-async def get_all_orders(store_id:int, db=Depends(get_database)):
+async def get_all_orders(store_id:int, db=Depends(get_database), limit:int=None, cursor:str=None, fields:str=None):
     try:
-        orders = await get_order_collection_delivered(store_id=store_id, db=db)
-        return orders
+        orders = await get_order_collection_delivered(store_id=store_id, db=db, limit=limit, cursor=cursor, fields=fields)
+        return MongoJSONResponse(orders)
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
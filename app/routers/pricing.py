@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from datetime import datetime
 from ..db.mongodb import get_database
@@ -7,7 +7,8 @@ from ..models.store_mongodb_models import Pricing
 from ..schemas.Pricing import UpdatePricing, DeletePricing
 from ..Service.pricing import create_pricing_collection, get_all_collection, delete_pricing_collection
 import logging
-from ..db.mysql_session import get_db
+from ..db.mysql_session import get_async_db
+from ..utils import MongoJSONResponse
 
 router = APIRouter()
 
@@ -16,7 +17,7 @@ logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 @router.post("/pricing/", response_model=Pricing, status_code=status.HTTP_201_CREATED)
-async def create_pricing(pricing: Pricing, db=Depends(get_database), mysql_db: Session = Depends(get_db)):
+async def create_pricing(pricing: Pricing, db=Depends(get_database), mysql_db: AsyncSession = Depends(get_async_db)):
     try:
         pricing_dict = await create_pricing_collection(pricing, db, mysql_db)
         return pricing_dict
@@ -25,16 +26,16 @@ async def create_pricing(pricing: Pricing, db=Depends(get_database), mysql_db: S
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
 @router.get("/pricings/", status_code=status.HTTP_200_OK)
-async def list_pricing(store_id: int, medicine_id: int, db=Depends(get_database), mysql_db: Session = Depends(get_db)):
+async def list_pricing(store_id: int, medicine_id: int, db=Depends(get_database), mysql_db: AsyncSession = Depends(get_async_db)):
     try:
         pricing_list = await get_all_collection(store_id=store_id, medicine_id=medicine_id, db=db, mysql_db=mysql_db)
-        return pricing_list
+        return MongoJSONResponse(pricing_list)
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
 @router.delete("/pricing/", response_model=DeletePricing, status_code=status.HTTP_200_OK)
-async def delete_pricing(pricing: DeletePricing, db=Depends(get_database), mysql_db: Session = Depends(get_db)):
+async def delete_pricing(pricing: DeletePricing, db=Depends(get_database), mysql_db: AsyncSession = Depends(get_async_db)):
     try:
         delete_result = await delete_pricing_collection(store_id=pricing.store_id, medicine_id=pricing.medicine_id, db=db, mysql_db=mysql_db)
         return delete_result
@@ -1,12 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List
 from ..db.mongodb import get_database
-from ..db.mysql_session import get_db
+from ..db.mysql_session import get_async_db
 from ..models.store_mongodb_models import Purchase
 import logging
-from ..Service.purchase import create_purchase_collection, get_all_purchase_list, get_purchase_collection_by_id, get_purchases_by_date_store, delete_purchase_collection
+from ..Service.purchase import create_purchase_collection, get_all_purchase_list, get_purchase_collection_by_id, get_purchases_by_date_store, delete_purchase_collection, export_purchases
+from fastapi.responses import StreamingResponse
+from ..utils import EXPORT_MEDIA_TYPES, MongoJSONResponse
 from ..schemas.Purchase import DeletePurchase
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter()
 
@@ -15,7 +17,7 @@ logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 @router.post("/purchases/", response_model=Purchase, status_code=status.HTTP_201_CREATED)
-async def create_purchase(purchase: Purchase, db=Depends(get_database), mysql_db: Session = Depends(get_db)):
+async def create_purchase(purchase: Purchase, db=Depends(get_database), mysql_db: AsyncSession = Depends(get_async_db)):
     try:
         purchase_dict = await create_purchase_collection(purchase, db, mysql_db=mysql_db)
         return purchase_dict
@@ -24,32 +26,41 @@ async def create_purchase(purchase: Purchase, db=Depends(get_database), mysql_db
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
 @router.get("/purchase/", status_code=status.HTTP_200_OK)
-async def get_purchase_by_id(purchase_id:str, db=Depends(get_database), mysql_db: Session = Depends(get_db)):
+async def get_purchase_by_id(purchase_id:str, db=Depends(get_database), mysql_db: AsyncSession = Depends(get_async_db)):
     try:
         purchases = await get_purchase_collection_by_id(purchase_id, db, mysql_db)
-        return purchases
+        return MongoJSONResponse(purchases)
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
 @router.get("/purchases/", status_code=status.HTTP_200_OK)
-async def get_all_purchases(store_id: int, db=Depends(get_database), mysql_db: Session = Depends(get_db)):
+async def get_all_purchases(store_id: int, db=Depends(get_database), mysql_db: AsyncSession = Depends(get_async_db), limit:int=None, cursor:str=None, fields:str=None):
     try:
-        purchases = await get_all_purchase_list(store_id, db, mysql_db)
-        return purchases
+        purchases = await get_all_purchase_list(store_id, db, mysql_db, limit=limit, cursor=cursor, fields=fields)
+        return MongoJSONResponse(purchases)
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
 @router.get("/purchases/date/", status_code=status.HTTP_200_OK)
-async def get_purchases_by_date(store_id: int, db=Depends(get_database), mysql_db: Session = Depends(get_db), start_date:str=None, end_date:str=None):
+async def get_purchases_by_date(store_id: int, db=Depends(get_database), mysql_db: AsyncSession = Depends(get_async_db), start_date:str=None, end_date:str=None, limit:int=None, cursor:str=None, fields:str=None):
     try:
-        purchases = await get_purchases_by_date_store(store_id=store_id, db=db, mysql_db=mysql_db, start_date=start_date, end_date=end_date)
-        return purchases
+        purchases = await get_purchases_by_date_store(store_id=store_id, db=db, mysql_db=mysql_db, start_date=start_date, end_date=end_date, limit=limit, cursor=cursor, fields=fields)
+        return MongoJSONResponse(purchases)
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
+@router.get("/purchases/export", status_code=status.HTTP_200_OK)
+async def get_purchases_export(store_id: int, db=Depends(get_database), start_date:str=None, end_date:str=None, format:str="ndjson"):
+    export_format, lines = export_purchases(store_id=store_id, db=db, start_date=start_date, end_date=end_date, export_format=format)
+    return StreamingResponse(
+        lines,
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f"attachment; filename=purchases_{store_id}.{export_format}"}
+    )
+
 @router.delete("/purchases/", response_model=DeletePurchase)
 async def delete_purchase(delete:DeletePurchase, db=Depends(get_database)):
     try:
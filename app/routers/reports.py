@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+from ..db.mongodb import get_database
+from ..db.mysql_session import get_async_db
+from ..Service.reports import get_sales_report, get_purchase_report, get_order_status_report
+from ..utils import MongoJSONResponse
+
+router = APIRouter()
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+@router.get("/reports/sales/", status_code=status.HTTP_200_OK)
+async def sales_report(store_id: int, db=Depends(get_database), mysql_db: AsyncSession = Depends(get_async_db), start_date: str = None, end_date: str = None, period: str = "day", top: int = 10):
+    try:
+        report = await get_sales_report(store_id, db, mysql_db, start_date=start_date, end_date=end_date, period=period, top=top)
+        return MongoJSONResponse(report)
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+@router.get("/reports/purchases/", status_code=status.HTTP_200_OK)
+async def purchase_report(store_id: int, db=Depends(get_database), mysql_db: AsyncSession = Depends(get_async_db), start_date: str = None, end_date: str = None, period: str = "day", top: int = 10):
+    try:
+        report = await get_purchase_report(store_id, db, mysql_db, start_date=start_date, end_date=end_date, period=period, top=top)
+        return MongoJSONResponse(report)
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+@router.get("/reports/orders/", status_code=status.HTTP_200_OK)
+async def order_status_report(store_id: int, db=Depends(get_database), mysql_db: AsyncSession = Depends(get_async_db), start_date: str = None, end_date: str = None):
+    try:
+        report = await get_order_status_report(store_id, db, mysql_db, start_date=start_date, end_date=end_date)
+        return MongoJSONResponse(report)
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
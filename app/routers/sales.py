@@ -4,10 +4,10 @@ from typing import List
 from ..db.mongodb import get_database
 from ..models.store_mongodb_models import Sale
 import logging
-from ..Service.sale import create_sale_collection, get_sale_particular, get_sales, delete_sale_collection 
+from ..Service.sale import create_sale_collection, get_sale_particular, get_sales, delete_sale_collection, export_sales
+from fastapi.responses import StreamingResponse
+from ..utils import EXPORT_MEDIA_TYPES, MongoJSONResponse
 from ..schemas.Sale import DeleteSale
-from ..db.mysql_session import get_db
-from sqlalchemy.orm import Session
 
 router = APIRouter()
 
@@ -16,19 +16,19 @@ logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 @router.post("/sales/", response_model=Sale, status_code=status.HTTP_201_CREATED)
-async def create_sale_order(sale: Sale, db=Depends(get_database), mysql_db:Session=Depends(get_db)):
+async def create_sale_order(sale: Sale, db=Depends(get_database)):
     try:
-        sale_dict = await create_sale_collection(sale, db, mysql_db)
+        sale_dict = await create_sale_collection(sale, db)
         return sale_dict
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
 @router.get("/sales/list/", status_code=status.HTTP_200_OK)
-async def read_sales(store_id:int, db=Depends(get_database)):
+async def read_sales(store_id:int, db=Depends(get_database), limit:int=None, cursor:str=None, fields:str=None):
     try:
-        sales = await get_sales(store_id=store_id, db=db)
-        return sales
+        sales = await get_sales(store_id=store_id, db=db, limit=limit, cursor=cursor, fields=fields)
+        return MongoJSONResponse(sales)
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
@@ -42,6 +42,15 @@ async def get_sale_order(sale_id: str, db=Depends(get_database)):
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
+@router.get("/sales/export", status_code=status.HTTP_200_OK)
+async def get_sales_export(store_id: int, db=Depends(get_database), start_date:str=None, end_date:str=None, format:str="ndjson"):
+    export_format, lines = export_sales(store_id=store_id, db=db, start_date=start_date, end_date=end_date, export_format=format)
+    return StreamingResponse(
+        lines,
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f"attachment; filename=sales_{store_id}.{export_format}"}
+    )
+
 @router.delete("/sales/", response_model=DeleteSale, status_code=status.HTTP_200_OK)
 async def delete_sale_order(sale: DeleteSale, db=Depends(get_database)):
     try:
@@ -4,10 +4,11 @@ from typing import List
 from ..db.mongodb import get_database
 from ..models.store_mongodb_models import Stock
 import logging
-from ..Service.stock import create_stock_collection, get_all_stocks_by_store, get_stock_collection_by_id, delete_stock_collection
-from ..db.mysql_session import get_db
-from sqlalchemy.orm import Session
+from ..Service.stock import create_stock_collection, get_all_stocks_by_store, get_stock_collection_by_id, delete_stock_collection, get_expiring_batches, get_reorder_points
+from ..db.mysql_session import get_async_db
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..schemas.Stock import DeleteStock
+from ..utils import MongoJSONResponse
 
 router = APIRouter()
 
@@ -16,7 +17,7 @@ logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 @router.post("/stocks/", response_model=Stock)
-async def create_stock(stock: Stock, db=Depends(get_database), mysql_db:Session=Depends(get_db)):
+async def create_stock(stock: Stock, db=Depends(get_database), mysql_db:AsyncSession=Depends(get_async_db)):
     try:
         stock_dict = await create_stock_collection(stock, db, mysql_db)
         return stock_dict
@@ -25,19 +26,42 @@ async def create_stock(stock: Stock, db=Depends(get_database), mysql_db:Session=
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
 
 @router.get("/stocks/")
-async def read_stocks(store_id: int, db=Depends(get_database), mysql_db:Session=Depends(get_db)):
+async def read_stocks(store_id: int, db=Depends(get_database), mysql_db:AsyncSession=Depends(get_async_db), limit:int=None, cursor:str=None, fields:str=None):
+    """
+    Stock listing of the store, one row per active medicine stock with the packets and units
+    of its latest purchase. Before the inventory_view it listed one row per purchase line of
+    every stock, inactive ones included.
+    """
     try:
-        stocks = await get_all_stocks_by_store(store_id, db, mysql_db)
-        return stocks
+        stocks = await get_all_stocks_by_store(store_id, db, mysql_db, limit=limit, cursor=cursor, fields=fields)
+        return MongoJSONResponse(stocks)
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
     
 @router.get("/stocks/medicines/")
-async def read_stock(store_id:int, medicine_id:int, db=Depends(get_database), mysql_db:Session=Depends(get_db)):
+async def read_stock(store_id:int, medicine_id:int, db=Depends(get_database), mysql_db:AsyncSession=Depends(get_async_db)):
     try:
         stock = await get_stock_collection_by_id(store_id=store_id, medicine_id=medicine_id, db=db, mysql_db=mysql_db)
-        return stock
+        return MongoJSONResponse(stock)
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+@router.get("/stocks/expiring/")
+async def read_expiring_batches(store_id: int, days: int = None, db=Depends(get_database), mysql_db:AsyncSession=Depends(get_async_db)):
+    try:
+        expiring = await get_expiring_batches(store_id=store_id, db=db, mysql_db=mysql_db, days=days)
+        return MongoJSONResponse(expiring)
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+@router.get("/stocks/reorder/")
+async def read_reorder_points(store_id: int, below_only: bool = True, limit: int = None, cursor: str = None, db=Depends(get_database), mysql_db:AsyncSession=Depends(get_async_db)):
+    try:
+        reorder = await get_reorder_points(store_id=store_id, db=db, mysql_db=mysql_db, below_only=below_only, limit=limit, cursor=cursor)
+        return MongoJSONResponse(reorder)
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
@@ -1,30 +1,180 @@
 from fastapi import Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, select, update
 from sqlalchemy.exc import SQLAlchemyError
 import logging
 from .db.mysql_session import get_db
+from .db.mysql import AsyncSessionLocal
 from .models.store_mysql_models import StoreDetails as StoreDetailsModel
 from .schemas.StoreDetailsSchema import StoreDetailsCreate
 from bson import ObjectId
-from datetime import datetime
+from bson.decimal128 import Decimal128
+from decimal import Decimal
+from datetime import datetime, timedelta
 from typing import List, Optional
-from .models.store_mysql_models import InvoiceLookup
+from collections import OrderedDict
+import asyncio
+import base64
+import csv
+import io
+import orjson
+import os
+import re
+import threading
+import time
+from .models.store_mysql_models import InvoiceLookup, MedicineMaster, Manufacturer
 
 # configuring the logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+MASTER_CACHE_SIZE = int(os.getenv("MASTER_CACHE_SIZE", "10000"))
+MASTER_CACHE_TTL = float(os.getenv("MASTER_CACHE_TTL", "300"))
+
+DEFAULT_PAGE_LIMIT = int(os.getenv("DEFAULT_PAGE_LIMIT", "100"))
+MAX_PAGE_LIMIT = int(os.getenv("MAX_PAGE_LIMIT", "1000"))
+# documents read per cursor batch by the streaming exports
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+# invoice numbers reserved per MySQL round trip. Above 1 the numbers of a block that are
+# held in memory and not handed out yet are lost when the process restarts, leaving a gap
+INVOICE_BLOCK_SIZE = int(os.getenv("INVOICE_BLOCK_SIZE", "1"))
+
+_MISSING = object()
+
+def orjson_default(obj):
+    """
+    Types orjson does not serialise natively, datetime and the enums it handles itself
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        obj = obj.to_decimal()
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+class MongoJSONResponse(ORJSONResponse):
+    """
+    orjson response that also takes Mongo documents as they are read
+    """
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+class MasterDataCache:
+    """
+    Size bounded LRU cache with a TTL for the master data lookups
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, table: str):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == table]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+master_cache = MasterDataCache(maxsize=MASTER_CACHE_SIZE, ttl=MASTER_CACHE_TTL)
+
+def invalidate_master_cache(model):
+    """
+    Drop the cached lookups of a master table after it has been written
+    """
+    master_cache.invalidate(model.__tablename__)
+
+def get_master_cache_stats():
+    """
+    Hit, miss and eviction counters of the master data cache
+    """
+    return master_cache.stats()
+
+def _lookup_row(value, model, field:str, db:Session):
+    """
+    Cached lookup of the first row matching the field, "unique" when there is none
+    """
+    key = (model.__tablename__, "row", field, value)
+    cached = master_cache.get(key)
+    if cached is not _MISSING:
+        return cached
+    result = db.query(model).filter(getattr(model, field) == value).first()
+    if result:
+        # detach the row so it stays readable after the request session is closed
+        db.expunge(result)
+    else:
+        result = "unique"
+    master_cache.set(key, result)
+    return result
+
+async def _lookup_row_async(value, model, field:str, db:AsyncSession):
+    """
+    Async version of _lookup_row for the AsyncSession
+    """
+    key = (model.__tablename__, "row", field, value)
+    cached = master_cache.get(key)
+    if cached is not _MISSING:
+        return cached
+    rows = await db.execute(select(model).where(getattr(model, field) == value).limit(1))
+    result = rows.scalars().first()
+    if result:
+        db.expunge(result)
+    else:
+        result = "unique"
+    master_cache.set(key, result)
+    return result
+
 def check_name_available(name:str, model, field:str, db:Session):
     """
     Checking the field available in the model
     """
     try:
-        name = db.query(model).filter(getattr(model, field) == name).first()
-        if name:
-            return name
-        else:
-            return "unique"
+        return _lookup_row(name, model, field, db)
     except SQLAlchemyError as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
@@ -70,11 +220,7 @@ def validate_by_id(id:int, model, field:str, db:Session):
     validation by the id to compare the mysql with mongodb
     """
     try:
-        result = db.query(model).filter(getattr(model, field) == id).first()
-        if result:
-            return result
-        else:
-            return "unique"
+        return _lookup_row(id, model, field, db)
     except SQLAlchemyError as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
@@ -84,11 +230,113 @@ def get_name_by_id(id:int, model, field:str, name_field:str, db:Session):
     Get the name by the id
     """
     try:
-        result = db.query(model).filter(getattr(model, field) == id).first()
-        if result:
-            return getattr(result, name_field)
-        else:
-            return "unique"
+        names = get_names_by_ids(ids=[id], model=model, field=field, name_field=name_field, db=db)
+        return names.get(id, "unique")
+    except SQLAlchemyError as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+def _cached_names(ids, model, field:str, name_field:str):
+    """
+    Split the ids into the cached names and the ids still to be queried
+    """
+    names = {}
+    missing = set()
+    for id in {id for id in ids if id is not None}:
+        cached = master_cache.get((model.__tablename__, "name", field, name_field, id))
+        if cached is _MISSING:
+            missing.add(id)
+        elif cached is not None:
+            names[id] = cached
+    return names, missing
+
+def _cache_names(rows, missing, model, field:str, name_field:str):
+    """
+    Cache the queried names, the misses as None so unknown ids are not re-queried
+    """
+    found = {key: name for key, name in rows}
+    for id in missing:
+        master_cache.set((model.__tablename__, "name", field, name_field, id), found.get(id))
+    return found
+
+def get_names_by_ids(ids, model, field:str, name_field:str, db:Session):
+    """
+    Get the names for a set of ids with a single IN query
+    """
+    try:
+        names, missing = _cached_names(ids, model, field, name_field)
+        if missing:
+            key_column = getattr(model, field)
+            rows = db.query(key_column, getattr(model, name_field)).filter(key_column.in_(missing)).all()
+            names.update(_cache_names(rows, missing, model, field, name_field))
+        return names
+    except SQLAlchemyError as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+async def validate_by_id_async(id:int, model, field:str, db:AsyncSession):
+    """
+    validate_by_id for the async routes
+    """
+    try:
+        return await _lookup_row_async(id, model, field, db)
+    except SQLAlchemyError as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+async def get_names_by_ids_async(ids, model, field:str, name_field:str, db:AsyncSession):
+    """
+    get_names_by_ids for the async routes
+    """
+    try:
+        names, missing = _cached_names(ids, model, field, name_field)
+        if missing:
+            key_column = getattr(model, field)
+            rows = await db.execute(select(key_column, getattr(model, name_field)).where(key_column.in_(missing)))
+            names.update(_cache_names(rows.all(), missing, model, field, name_field))
+        return names
+    except SQLAlchemyError as e:
+        logger.error(f"Database error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+async def get_name_by_id_async(id:int, model, field:str, name_field:str, db:AsyncSession):
+    """
+    get_name_by_id for the async routes
+    """
+    names = await get_names_by_ids_async(ids=[id], model=model, field=field, name_field=name_field, db=db)
+    return names.get(id, "unique")
+
+def normalize_composition(composition: Optional[str]):
+    """
+    Canonical composition so the brands of the same molecules match:
+    lower case, single spaces and the ingredients in sorted order
+    """
+    if not composition:
+        return None
+    parts = (" ".join(part.split()) for part in re.split(r"[+,]", composition.lower()))
+    return " + ".join(sorted(part for part in parts if part))[:255] or None
+
+async def get_substitutes_async(medicine_id: int, db: AsyncSession):
+    """
+    Medicines sharing the normalised composition of the medicine, with their manufacturer names
+    """
+    try:
+        key = (MedicineMaster.__tablename__, "substitutes", "medicine_id", medicine_id)
+        substitutes = master_cache.get(key)
+        if substitutes is _MISSING:
+            medicine = aliased(MedicineMaster)
+            composition_key = select(medicine.composition_key).where(medicine.medicine_id == medicine_id).scalar_subquery()
+            rows = await db.execute(
+                select(MedicineMaster.medicine_id, MedicineMaster.medicine_name, MedicineMaster.manufacturer_id)
+                .where(MedicineMaster.composition_key == composition_key)
+            )
+            substitutes = [tuple(row) for row in rows.all()]
+            master_cache.set(key, substitutes)
+        manufacturers = await get_names_by_ids_async(ids={row[2] for row in substitutes}, model=Manufacturer, field="manufacturer_id", name_field="manufacturer_name", db=db)
+        return [
+            {"medicine_id": id, "medicine_name": name, "manufacturer_name": manufacturers.get(manufacturer_id)}
+            for id, name, manufacturer_id in substitutes
+        ]
     except SQLAlchemyError as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
@@ -107,6 +355,18 @@ def check_id_available_mongodb(id:str, model:str, db):
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error: " + str(e))
     
+CUSTOMER_PROJECTION = {"name": 1, "email": 1, "mobile": 1, "address": 1, "doctor_name": 1}
+
+async def get_customers_by_ids(customer_ids, db, projection: dict = CUSTOMER_PROJECTION):
+    """
+    Customers keyed by their id string, fetched with a single $in query
+    """
+    object_ids = {ObjectId(str(id)) for id in customer_ids if ObjectId.is_valid(str(id))}
+    if not object_ids:
+        return {}
+    customers = await db.customers.find({"_id": {"$in": list(object_ids)}}, projection).to_list(length=None)
+    return {str(customer["_id"]): customer for customer in customers}
+
 def discount(mrp, discount):
     """
     Discounted price
@@ -115,27 +375,215 @@ def discount(mrp, discount):
     price = mrp - (mrp * discount / 100)
     return price
 
-async def create_sale_invoice(store_id: int, mysql_db: Session):
+class InvoiceAllocator:
+    """
+    Per store invoice sequence kept on the latest invoice_lookup row of the store.
+    Numbers are reserved in blocks under SELECT ... FOR UPDATE and handed out in
+    process, so they stay unique across workers and gap-free within a block.
+    Blocks are reserved in a session of their own, the request session is never committed.
+    """
+    def __init__(self, block_size: int):
+        self.block_size = max(1, block_size)
+        self._blocks = {}
+        self._locks = {}
+
+    async def next_invoice(self, store_id: int):
+        lock = self._locks.setdefault(store_id, asyncio.Lock())
+        async with lock:
+            block = self._blocks.get(store_id)
+            if block is None or block["next"] > block["last"]:
+                block = await self._reserve_block(store_id)
+                self._blocks[store_id] = block
+            number = block["next"]
+            block["next"] += 1
+            return self._format(block, number)
+
+    async def release(self, store_id: int, invoice_number: str):
+        """
+        Give back the last number handed out for the store, its sale was not written.
+        Returns False when a later number was already handed out, the number can't be reused then.
+        """
+        lock = self._locks.setdefault(store_id, asyncio.Lock())
+        async with lock:
+            block = self._blocks.get(store_id)
+            if block is None or self._format(block, block["next"] - 1) != invoice_number:
+                return False
+            if block["next"] <= block["last"]:
+                block["next"] -= 1
+                return True
+            # the block is used up, move the stored counter back unless another worker reserved after it
+            async with AsyncSessionLocal() as session:
+                async with session.begin():
+                    result = await session.execute(
+                        update(InvoiceLookup)
+                        .where(InvoiceLookup.invoicelookup_id == block["lookup_id"], InvoiceLookup.last_invoice_number == invoice_number)
+                        .values(last_invoice_number=self._format(block, block["last"] - 1), updated_at=datetime.now())
+                    )
+            if result.rowcount != 1:
+                return False
+            del self._blocks[store_id]
+            return True
+
+    @staticmethod
+    def _format(block: dict, number: int):
+        return block["prefix"] + str(number).zfill(block["width"])
+
+    async def _reserve_block(self, store_id: int):
+        async with AsyncSessionLocal() as session:
+            async with session.begin():
+                rows = await session.execute(
+                    select(InvoiceLookup)
+                    .where(InvoiceLookup.store_id == store_id)
+                    .order_by(InvoiceLookup.invoicelookup_id.desc())
+                    .limit(1)
+                    .with_for_update()
+                )
+                invoice_details = rows.scalars().first()
+                if not invoice_details:
+                    raise HTTPException(status_code=404, detail="Previous invoice not found")
+                # Logic for the invoice => "MED242500001" -> "MED242500002"
+                previous_invoice = invoice_details.last_invoice_number
+                prefix, width = previous_invoice[:7], len(previous_invoice) - 7
+                first = int(previous_invoice[7:]) + 1
+                last = first + self.block_size - 1
+                invoice_details.last_invoice_number = prefix + str(last).zfill(width)
+                invoice_details.updated_at = datetime.now()
+                lookup_id = invoice_details.invoicelookup_id
+        return {"lookup_id": lookup_id, "prefix": prefix, "width": width, "next": first, "last": last}
+
+invoice_allocator = InvoiceAllocator(block_size=INVOICE_BLOCK_SIZE)
+
+async def create_sale_invoice(store_id: int):
     """
     Create a new sale invoice.
     """
     try:
-        # Logic for the invoice => "MED242500001" -> "MED242500002"
-        invoice_details = mysql_db.query(InvoiceLookup).filter(InvoiceLookup.store_id == store_id).order_by(InvoiceLookup.invoicelookup_id.desc()).first()
-        if not invoice_details:
-            raise HTTPException(status_code=404, detail="Previous invoice not found")
-        previous_invoice = invoice_details.last_invoice_number
-        new_invoice = previous_invoice[:7] + str(int(previous_invoice[7:]) + 1).zfill(len(previous_invoice) - 7)
-        invoices = InvoiceLookup(
-            store_id=store_id,
-            last_invoice_number=new_invoice,
-            created_at=datetime.now(),
-            updated_at=datetime.now(),
-            active_flag=1
-        )
-        mysql_db.add(invoices)
-        mysql_db.commit()
-        return new_invoice
+        return await invoice_allocator.next_invoice(store_id=store_id)
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
-        raise HTTPException(status_code=500, detail="Database error: " + str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Database error: " + str(e))
+
+async def release_sale_invoice(store_id: int, invoice_number: str, db):
+    """
+    Give back the invoice number of a sale that was not written, or record it in
+    void_invoices when a later number was already handed out
+    """
+    try:
+        if await invoice_allocator.release(store_id, invoice_number):
+            return
+        await db.void_invoices.insert_one({"store_id": store_id, "invoice_id": invoice_number, "created_at": datetime.now()})
+        logger.warning(f"Invoice {invoice_number} of store {store_id} recorded as void")
+    except Exception as e:
+        # the sale error is what the caller raises, a failed release is only logged
+        logger.error(f"Error releasing invoice {invoice_number} of store {store_id}: {str(e)}")
+
+def get_page_limit(limit: Optional[int] = None):
+    """
+    Page size clamped between 1 and MAX_PAGE_LIMIT
+    """
+    if limit is None:
+        return DEFAULT_PAGE_LIMIT
+    return max(1, min(int(limit), MAX_PAGE_LIMIT))
+
+def encode_cursor(last_id):
+    """
+    Opaque next_cursor token for the last _id of a page
+    """
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode()
+
+def decode_cursor(cursor: Optional[str]):
+    """
+    ObjectId carried by a next_cursor token, None for the first page
+    """
+    if not cursor:
+        return None
+    try:
+        return ObjectId(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def cursor_query(query: dict, cursor: Optional[str]):
+    """
+    Add the keyset condition on _id for the page after the cursor
+    """
+    last_id = decode_cursor(cursor)
+    if last_id is None:
+        return query
+    return {**query, "_id": {"$gt": last_id}}
+
+def parse_fields(fields: Optional[str]):
+    """
+    Comma separated fields= parameter as a set, None when every field is wanted
+    """
+    if not fields:
+        return None
+    return {field.strip() for field in fields.split(",") if field.strip()}
+
+def select_fields(item: dict, fields: Optional[set]):
+    """
+    Keep only the requested fields of a response item
+    """
+    if not fields:
+        return item
+    return {key: value for key, value in item.items() if key in fields}
+
+def build_page(items: list, next_id=None):
+    """
+    Paginated response with the opaque cursor of the next page
+    """
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(next_id) if next_id is not None else None
+    }
+
+def get_export_format(export_format: Optional[str]):
+    """
+    Validated export format, ndjson by default
+    """
+    export_format = (export_format or "ndjson").lower()
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Export format must be one of: " + ", ".join(EXPORT_MEDIA_TYPES))
+    return export_format
+
+def parse_date_range(start_date: Optional[str], end_date: Optional[str]):
+    """
+    Start and end of a YYYY-MM-DD range, the end date is included
+    """
+    try:
+        start = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+        end = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1) if end_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be in YYYY-MM-DD format")
+    return start, end
+
+async def batched(cursor, size: int = EXPORT_BATCH_SIZE):
+    """
+    Group the documents of a Motor cursor into lists of at most size documents
+    """
+    batch = []
+    async for document in cursor:
+        batch.append(document)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def export_lines(rows, columns: list, export_format: str):
+    """
+    Encode an async iterator of flat rows as NDJSON or CSV, one line at a time
+    """
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        yield buffer.getvalue()
+        async for row in rows:
+            buffer.seek(0)
+            buffer.truncate(0)
+            writer.writerow(row)
+            yield buffer.getvalue()
+    else:
+        async for row in rows:
+            # same encoding as the JSON responses
+            yield orjson.dumps({column: row.get(column) for column in columns}, default=orjson_default, option=orjson.OPT_NON_STR_KEYS) + b"\n"
@@ -0,0 +1,178 @@
+"""
+Seeded synthetic pharmacy dataset for the benchmarks.
+
+Master data goes to the SQLAlchemy engine of the app (SQLite stands in for
+MySQL), the store documents to the Motor database handed in, mongomock or a
+local mongod. The same seed always gives the same dataset.
+"""
+from datetime import datetime, timedelta
+import random
+from bson import ObjectId
+
+COMPOSITIONS = [
+    "Paracetamol 500mg", "Paracetamol 650mg", "Ibuprofen 400mg", "Amoxicillin 500mg", "Azithromycin 500mg",
+    "Cetirizine 10mg", "Metformin 500mg", "Amlodipine 5mg", "Atorvastatin 10mg", "Pantoprazole 40mg",
+    "Omeprazole 20mg", "Losartan 50mg", "Montelukast 10mg", "Levocetirizine 5mg", "Ciprofloxacin 500mg",
+    "Paracetamol 325mg + Ibuprofen 400mg", "Amoxicillin 500mg + Clavulanic Acid 125mg", "Telmisartan 40mg",
+    "Rosuvastatin 10mg", "Vitamin D3 60000IU"
+]
+FORMS = ["tablet", "capsule", "liquid", "injection", "powder"]
+PACKAGES = [("strip", 10), ("bottle", 1), ("vial", 1), ("sachet", 5)]
+ORDER_STATUSES = ["pending", "processing", "shipped", "delivered", "cancelled"]
+PAYMENT_METHODS = ["online", "cash", "cod"]
+
+class DatasetSize:
+    """
+    Knobs of the generated dataset
+    """
+    def __init__(self, stores=3, medicines=300, manufacturers=40, distributors=20, customers=500, days=365,
+                 purchases_per_day=2, sales_per_day=10, orders_per_day=3, seed=42):
+        self.stores = stores
+        self.medicines = medicines
+        self.manufacturers = manufacturers
+        self.distributors = distributors
+        self.customers = customers
+        self.days = days
+        self.purchases_per_day = purchases_per_day
+        self.sales_per_day = sales_per_day
+        self.orders_per_day = orders_per_day
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+def seed_mysql(session, models, size: DatasetSize, rng: random.Random, normalize_composition):
+    """
+    Stores with their invoice numbering, manufacturers, categories, distributors and medicines sharing compositions
+    """
+    now = datetime.now()
+    for index in range(1, size.stores + 1):
+        session.add(models.StoreDetails(
+            store_id=index, store_name=f"Store {index}", license_number=f"LIC{index:05d}", gst_state_code="29",
+            gst_number=f"29ABCDE{index:04d}F1Z5", pan=f"ABCDE{index:04d}F", address=f"{index} Market Road",
+            email=f"store{index}@example.com", mobile=f"90000{index:05d}", owner_name=f"Owner {index}",
+            is_main_store=index == 1, latitude=12.97 + index / 100, longitude=77.59 + index / 100,
+            active_flag=1, created_at=now, updated_at=now
+        ))
+        # sale invoices continue from the last number of the store
+        session.add(models.InvoiceLookup(
+            store_id=index, last_invoice_number=f"INV{index:04d}00000", active_flag=1, created_at=now, updated_at=now
+        ))
+    for index in range(1, size.manufacturers + 1):
+        session.add(models.Manufacturer(manufacturer_id=index, manufacturer_name=f"Manufacturer {index}", active_flag=1, created_at=now, updated_at=now))
+    for index, name in enumerate(["Analgesic", "Antibiotic", "Antihistamine", "Cardiac", "Diabetic", "Gastro", "Supplement"], start=1):
+        session.add(models.Category(category_id=index, category_name=name, active_flag=1, created_at=now, updated_at=now))
+    for index in range(1, size.distributors + 1):
+        session.add(models.Distributor(distributor_id=index, distributor_name=f"Distributor {index}", active_flag=1, created_at=now, updated_at=now))
+    for index in range(1, size.medicines + 1):
+        composition = rng.choice(COMPOSITIONS)
+        session.add(models.MedicineMaster(
+            medicine_id=index, medicine_name=f"{composition.split()[0]} Brand {index}", generic_name=composition.split()[0],
+            hsn_code="3004", formulation=rng.choice(FORMS), strength=composition.split()[-1], unit_of_measure="mg",
+            manufacturer_id=rng.randint(1, size.manufacturers), category_id=rng.randint(1, 7), composition=composition,
+            composition_key=normalize_composition(composition), active_flag=1, created_at=now, updated_at=now
+        ))
+    session.commit()
+
+async def seed_mongo(db, size: DatasetSize, rng: random.Random):
+    """
+    Customers, then per store years of purchases, sales and orders with the stocks and pricing they imply
+    """
+    customers = [
+        {"_id": ObjectId(), "name": f"Customer {index}", "mobile": f"80000{index:05d}", "email": f"customer{index}@example.com",
+         "address": f"{index} Lake View", "doctor_name": f"Dr. {rng.choice(['Rao', 'Iyer', 'Khan', 'Das'])}"}
+        for index in range(1, size.customers + 1)
+    ]
+    await db.customers.insert_many(customers)
+    start = datetime.now() - timedelta(days=size.days)
+    for store_id in range(1, size.stores + 1):
+        stock_medicines = rng.sample(range(1, size.medicines + 1), k=max(1, size.medicines * 2 // 3))
+        batches = {medicine_id: [] for medicine_id in stock_medicines}
+        purchases, sales, orders, pricing = [], [], [], []
+        for day in range(size.days):
+            date = start + timedelta(days=day)
+            for _ in range(size.purchases_per_day):
+                items = []
+                for medicine_id in rng.sample(stock_medicines, k=min(5, len(stock_medicines))):
+                    package, units = rng.choice(PACKAGES)
+                    quantity = rng.randint(10, 200)
+                    mrp = round(rng.uniform(5, 500), 2)
+                    expiry = date + timedelta(days=rng.randint(60, 900))
+                    batch_number = f"B{store_id}{medicine_id}{day}{len(items)}"
+                    items.append({
+                        "medicine_id": medicine_id, "batch_number": batch_number, "expiry_date": expiry,
+                        "manufacture_id": rng.randint(1, size.manufacturers), "medicine_form": rng.choice(FORMS),
+                        "package_type": package, "units_per_package_type": units, "packagetype_quantity": units,
+                        "purchase_mrp": mrp, "purchase_discount": 0, "purchase_amount": round(mrp * quantity, 2),
+                        "purchase_quantity": quantity
+                    })
+                    batches[medicine_id].append({
+                        "expiry_date": expiry, "units_in_pack": units, "batch": quantity,
+                        "batch_number": batch_number, "is_active": 1
+                    })
+                purchases.append({
+                    "store_id": store_id, "purchase_date": date, "distributor_id": rng.randint(1, size.distributors),
+                    "purchased_amount": round(sum(item["purchase_amount"] for item in items), 2),
+                    "invoice_number": f"PI{store_id}-{len(purchases) + 1}", "discount": 0,
+                    "mrp": round(sum(item["purchase_mrp"] for item in items), 2), "created_at": date, "updated_at": date,
+                    "active_flag": 1, "purchase_items": items
+                })
+            for _ in range(size.sales_per_day):
+                items = []
+                for medicine_id in rng.sample(stock_medicines, k=rng.randint(1, 3)):
+                    live = [batch for batch in batches[medicine_id] if batch["batch"] > 0]
+                    if not live:
+                        continue
+                    batch = min(live, key=lambda batch: batch["expiry_date"])
+                    quantity = min(batch["batch"], rng.randint(1, 5))
+                    batch["batch"] -= quantity
+                    items.append({
+                        "medicine_id": medicine_id, "batch_id": batch["batch_number"], "expiry_date": batch["expiry_date"],
+                        "quantity": quantity, "price": round(rng.uniform(5, 500), 2)
+                    })
+                if items:
+                    sale_date = date + timedelta(minutes=rng.randint(0, 720))
+                    sales.append({
+                        "store_id": store_id, "sale_date": str(sale_date), "customer_id": str(rng.choice(customers)["_id"]),
+                        "total_amount": round(sum(item["price"] * item["quantity"] for item in items), 2),
+                        "invoice_id": f"{store_id}{len(sales) + 1:08d}", "created_at": sale_date, "updated_at": sale_date,
+                        "active_flag": 1, "sale_items": items
+                    })
+            for _ in range(size.orders_per_day):
+                items = [
+                    {"medicine_id": medicine_id, "quantity": rng.randint(1, 5), "price": round(rng.uniform(5, 500), 2), "unit": "strip"}
+                    for medicine_id in rng.sample(stock_medicines, k=rng.randint(1, 4))
+                ]
+                # the recent orders are still open
+                status = rng.choice(ORDER_STATUSES) if day < size.days - 7 else "pending"
+                orders.append({
+                    "store_id": store_id, "customer_id": str(rng.choice(customers)["_id"]), "order_date": date,
+                    "order_status": status, "payment_method": rng.choice(PAYMENT_METHODS),
+                    "total_amount": round(sum(item["price"] * item["quantity"] for item in items), 2),
+                    "order_items": items, "created_at": date, "updated_at": date, "active_flag": 1
+                })
+        now = datetime.now()
+        stocks = [
+            {"store_id": store_id, "medicine_id": medicine_id, "medicine_form": rng.choice(FORMS),
+             "available_stock": sum(batch["batch"] for batch in medicine_batches), "batch_details": medicine_batches,
+             "created_at": now, "updated_at": now, "active_flag": 1}
+            for medicine_id, medicine_batches in batches.items()
+        ]
+        for medicine_id in stock_medicines:
+            mrp = round(rng.uniform(5, 500), 2)
+            discount = rng.choice([0, 5, 10])
+            pricing.append({
+                "store_id": store_id, "medicine_id": medicine_id, "price": round(mrp * (100 - discount) / 100, 2),
+                "mrp": mrp, "discount": discount, "net_rate": round(mrp * 0.8, 2), "is_active": True,
+                "last_updated_by": "benchmark", "created_at": now, "updated_at": now, "active_flag": 1
+            })
+        for collection, documents in (("purchases", purchases), ("sales", sales), ("orders", orders), ("stocks", stocks), ("pricing", pricing)):
+            if documents:
+                await db[collection].insert_many(documents)
+    return {
+        "customers": len(customers),
+        "purchases": await db.purchases.count_documents({}),
+        "sales": await db.sales.count_documents({}),
+        "orders": await db.orders.count_documents({}),
+        "stocks": await db.stocks.count_documents({})
+    }
@@ -0,0 +1,289 @@
+"""
+Benchmark harness for the /storeapi routers.
+
+Seeds a synthetic pharmacy dataset, drives the routers in-process through an
+ASGI client and writes latency percentiles, throughput and per request query
+counts of every endpoint to a JSON file that later runs can be compared with.
+
+    python benchmarks/run.py                                  # SQLite + mongomock
+    python benchmarks/run.py --mongo-url mongodb://localhost:27017
+    python benchmarks/run.py --compare benchmarks/results/baseline.json --fail-over 20
+
+Needs httpx and aiosqlite, plus mongomock-motor unless --mongo-url is given:
+
+    pip install -r benchmarks/requirements.txt
+
+Mongo query counts are only reported against a real mongod, mongomock does
+not emit command events.
+"""
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from dataset import DatasetSize, seed_mysql, seed_mongo
+
+def import_app(workdir: str):
+    """
+    Import the app against a SQLite database in workdir, the repository is mounted as the istore package
+    """
+    database = os.path.join(workdir, "istore.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{database}"
+    os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{database}"
+    # mongomock has no transactions, and the indexes are created below when there is a real mongod
+    os.environ.setdefault("MONGO_TRANSACTIONS", "false")
+    os.environ["MONGO_ENSURE_INDEXES"] = "false"
+    if "istore" not in sys.modules:
+        package = types.ModuleType("istore")
+        package.__path__ = [ROOT]
+        sys.modules["istore"] = package
+    from istore.app import main, utils
+    from istore.app.db import mysql, mongodb, metrics, indexes
+    from istore.app.models import store_mysql_models
+    from istore.app.crud.inventory import rebuild_inventory_view_db
+    return types.SimpleNamespace(
+        main=main, utils=utils, mysql=mysql, mongodb=mongodb, metrics=metrics, indexes=indexes,
+        models=store_mysql_models, rebuild_inventory_view_db=rebuild_inventory_view_db
+    )
+
+def mongo_database(app, mongo_url: str = None):
+    """
+    Motor database on a local mongod, or mongomock when no url is given
+    """
+    if mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(mongo_url, event_listeners=[app.metrics.command_listener])
+        return client[f"istore_bench_{int(time.time())}"], client
+    from mongomock_motor import AsyncMongoMockClient
+    client = AsyncMongoMockClient()
+    return client["istore_bench"], client
+
+def scenarios(size: DatasetSize, rng: random.Random, customers: list, stocked: list):
+    """
+    Name, method, path and a factory of query params or JSON body per endpoint,
+    the medicine endpoints pick from the (store_id, medicine_id) pairs that have stock
+    """
+    today = datetime.now()
+    def store():
+        return rng.randint(1, size.stores)
+    def stock():
+        store_id, medicine_id = rng.choice(stocked)
+        return {"store_id": store_id, "medicine_id": medicine_id}
+    def month():
+        end = today - timedelta(days=rng.randint(0, max(size.days - 30, 0)))
+        return (end - timedelta(days=30)).strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+    def purchases_by_date():
+        start, end = month()
+        return {"params": {"store_id": store(), "start_date": start, "end_date": end}}
+    def sales_export():
+        start, end = month()
+        return {"params": {"store_id": store(), "start_date": start, "end_date": end, "format": "csv"}}
+    def sale_create():
+        store_id, medicine_id = rng.choice(stocked)
+        return {"json": {
+            "store_id": store_id, "sale_date": today.isoformat(), "customer_id": str(rng.choice(customers)),
+            "total_amount": 10.0, "invoice_id": "", "sale_items": [
+                {"medicine_id": medicine_id, "batch_id": "", "expiry_date": (today + timedelta(days=365)).isoformat(), "quantity": 1, "price": 10.0}
+            ]
+        }}
+    return [
+        ("stocks_list", "GET", "/storeapi/stocks/", lambda: {"params": {"store_id": store()}}),
+        ("stock_detail", "GET", "/storeapi/stocks/medicines/", lambda: {"params": stock()}),
+        ("purchases_list", "GET", "/storeapi/purchases/", lambda: {"params": {"store_id": store()}}),
+        ("purchases_by_date", "GET", "/storeapi/purchases/date/", purchases_by_date),
+        ("sales_list", "GET", "/storeapi/sales/list/", lambda: {"params": {"store_id": store()}}),
+        ("sales_export", "GET", "/storeapi/sales/export", sales_export),
+        ("orders_pending", "GET", "/storeapi/orders/pending/", lambda: {"params": {"store_id": store()}}),
+        ("pricing_list", "GET", "/storeapi/pricings/", lambda: {"params": stock()}),
+        ("medicine_master_list", "GET", "/storeapi/medicine_master/", lambda: {}),
+        ("sale_create", "POST", "/storeapi/sales/", sale_create),
+    ]
+
+def parse_server_timing(header: str):
+    """
+    Query counts per backend from the Server-Timing header of the timing middleware
+    """
+    counts = {}
+    for part in (header or "").split(","):
+        fields = [field.strip() for field in part.split(";")]
+        for field in fields[1:]:
+            if field.startswith("desc="):
+                counts[fields[0]] = int(field[5:].strip('"').split()[0])
+    return counts
+
+def percentile(values: list, fraction: float):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarise(latencies: list, statuses: list, queries: list, wall: float):
+    """
+    Percentiles in milliseconds, throughput and mean queries of one endpoint
+    """
+    return {
+        "requests": len(latencies),
+        "errors": sum(1 for status in statuses if status >= 400),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 3),
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p90": round(percentile(latencies, 0.90) * 1000, 3),
+            "p95": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "max": round(max(latencies) * 1000, 3)
+        },
+        "queries_per_request": {
+            backend: round(statistics.mean(count.get(backend, 0) for count in queries), 2)
+            for backend in ("mysql", "mongo")
+        }
+    }
+
+async def drive(client, method: str, path: str, request_args, requests: int, concurrency: int):
+    """
+    Send the requests with at most concurrency in flight
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses, queries = [], [], []
+
+    async def one():
+        async with semaphore:
+            kwargs = request_args()
+            start = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            await response.aread()
+            latencies.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+            queries.append(parse_server_timing(response.headers.get("server-timing")))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return summarise(latencies, statuses, queries, time.perf_counter() - start)
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results: dict, baseline_path: str, fail_over: float = None):
+    """
+    Print the p50/p95 change of every endpoint against a previous run, True when one regressed past fail_over percent
+    """
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressed = False
+    print(f"{'endpoint':<24}{'p50 ms':>12}{'change':>10}{'p95 ms':>12}{'change':>10}")
+    for name, result in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous:
+            print(f"{name:<24}{result['latency_ms']['p50']:>12}{'new':>10}{result['latency_ms']['p95']:>12}{'new':>10}")
+            continue
+        changes = []
+        for key in ("p50", "p95"):
+            before, after = previous["latency_ms"][key], result["latency_ms"][key]
+            change = (after - before) / before * 100 if before else 0.0
+            changes.append(change)
+            if fail_over is not None and change > fail_over:
+                regressed = True
+        print(f"{name:<24}{result['latency_ms']['p50']:>12}{changes[0]:>9.1f}%{result['latency_ms']['p95']:>12}{changes[1]:>9.1f}%")
+    return regressed
+
+async def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the /storeapi routers on a synthetic dataset")
+    parser.add_argument("--stores", type=int, default=3)
+    parser.add_argument("--medicines", type=int, default=300)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--sales-per-day", type=int, default=10)
+    parser.add_argument("--purchases-per-day", type=int, default=2)
+    parser.add_argument("--orders-per-day", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--endpoints", help="comma separated subset of the endpoint names")
+    parser.add_argument("--mongo-url", help="local mongod to use instead of mongomock")
+    parser.add_argument("--output", help="results file, defaults to benchmarks/results/<timestamp>.json")
+    parser.add_argument("--compare", help="previous results file to compare with")
+    parser.add_argument("--fail-over", type=float, help="exit 1 when a p50 or p95 regresses by more than this percent")
+    args = parser.parse_args(argv)
+
+    size = DatasetSize(stores=args.stores, medicines=args.medicines, days=args.days, sales_per_day=args.sales_per_day,
+                       purchases_per_day=args.purchases_per_day, orders_per_day=args.orders_per_day, seed=args.seed)
+    rng = random.Random(args.seed)
+    import httpx
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = import_app(workdir)
+        app.models.Base.metadata.create_all(app.mysql.engine)
+        with app.mysql.SessionLocal() as session:
+            seed_mysql(session, app.models, size, rng, app.utils.normalize_composition)
+
+        db, client = mongo_database(app, args.mongo_url)
+        app.main.app.dependency_overrides[app.mongodb.get_database] = lambda: db
+        seeding = time.perf_counter()
+        counts = await seed_mongo(db, size, rng)
+        if args.mongo_url:
+            await app.indexes.ensure_indexes(db)
+        async with app.mysql.AsyncSessionLocal() as mysql_db:
+            await app.rebuild_inventory_view_db(db, mysql_db)
+        print(f"Seeded {counts} in {time.perf_counter() - seeding:.1f}s")
+
+        customers = await db.customers.distinct("_id")
+        stocked = [(stock["store_id"], stock["medicine_id"]) async for stock in db.stocks.find({}, {"store_id": 1, "medicine_id": 1})]
+        selected = set(args.endpoints.split(",")) if args.endpoints else None
+        results = {
+            "meta": {
+                "started_at": datetime.now().isoformat(),
+                "revision": git_revision(),
+                "python": sys.version.split()[0],
+                "mongo": args.mongo_url or "mongomock",
+                "mysql": "sqlite",
+                "requests": args.requests,
+                "warmup": args.warmup,
+                "concurrency": args.concurrency,
+                "dataset": {**size.as_dict(), **counts}
+            },
+            "endpoints": {}
+        }
+        transport = httpx.ASGITransport(app=app.main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as http:
+            for name, method, path, request_args in scenarios(size, rng, customers, stocked):
+                if selected and name not in selected:
+                    continue
+                if args.warmup:
+                    await drive(http, method, path, request_args, args.warmup, args.concurrency)
+                results["endpoints"][name] = await drive(http, method, path, request_args, args.requests, args.concurrency)
+                summary = results["endpoints"][name]
+                print(f"{name:<24}p50 {summary['latency_ms']['p50']:>9} ms  p95 {summary['latency_ms']['p95']:>9} ms  "
+                      f"{summary['throughput_rps']:>8} req/s  queries {summary['queries_per_request']}  errors {summary['errors']}")
+        if args.mongo_url:
+            await client.drop_database(db.name)
+        app.mysql.engine.dispose()
+        await app.mysql.async_engine.dispose()
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%dT%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare and compare(results, args.compare, args.fail_over):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))